@@ -0,0 +1,61 @@
+import os
+import pyglet
+
+ATLAS_SIZE = 2048
+
+# full screen images are loaded on their own by the window
+EXCLUDE = ['images/mask1.jpg', 'images/mask2.png']
+
+images = {}
+animations = {}
+texture_bin = None
+
+def add_to_atlas(image):
+    global texture_bin
+    if texture_bin is None:
+        texture_bin = pyglet.image.atlas.TextureBin(ATLAS_SIZE, ATLAS_SIZE)
+    try:
+        return texture_bin.add(image)
+    except pyglet.image.atlas.AllocatorException:
+        # too large for an atlas page
+        return image.get_texture()
+        
+def load_image(path):
+    # images are shared between every sprite using them, callers should
+    # not change them (anchors are already centered)
+    if path not in images:
+        image = pyglet.image.load(path, file=pyglet.resource.file(path))
+        image = add_to_atlas(image)
+        image.anchor_x = image.width // 2
+        image.anchor_y = image.height // 2
+        images[path] = image
+    return images[path]
+    
+def frame_files(path):
+    files = [file for file in os.listdir(path) if file.endswith('.png')]
+    def key(file):
+        name = file[:-4]
+        return (0, int(name), '') if name.isdigit() else (1, 0, name)
+    return sorted(files, key=key)
+    
+def load_animation(path, duration, last_duration=None):
+    key = (path, duration, last_duration)
+    if key not in animations:
+        frames = []
+        for file in frame_files(path):
+            image = load_image(path + '/' + file)
+            frame = pyglet.image.AnimationFrame(image, duration)
+            frames.append(frame)
+        frames[-1].duration = last_duration
+        animations[key] = pyglet.image.Animation(frames)
+    return animations[key]
+    
+def image_paths(path='images'):
+    # every sprite image, the window preloads them in this order
+    paths = []
+    for root, dirs, files in os.walk(path):
+        for file in sorted(files):
+            name = root.replace(os.sep, '/') + '/' + file
+            if file.endswith('.png') and name not in EXCLUDE:
+                paths.append(name)
+    return paths
@@ -0,0 +1,191 @@
+import argparse
+import headless
+import json
+import model
+import multiprocessing
+import numpy as np
+import physics
+import random
+
+# per level results, one row per level
+RESULTS = ['ticks', 'fuel', 'crashed', 'waypoints']
+
+class Batch(object):
+    # many independent single ship levels stepped together, every array
+    # has one row per level so each physics step is a handful of numpy
+    # operations whatever the number of levels
+    def __init__(self, seeds, policy=None, width=headless.WIDTH, height=headless.HEIGHT,
+            padding=25, n_planets=5, n_waypoints=5, dt=1):
+        self.seeds = list(seeds)
+        self.policy = policy
+        self.dt = dt
+        count = len(self.seeds)
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.dx = np.zeros(count)
+        self.dy = np.zeros(count)
+        self.fx = np.zeros(count)
+        self.fy = np.zeros(count)
+        self.planets = np.zeros((count, n_planets, 3))
+        self.waypoints = np.zeros((count, n_waypoints, 3))
+        for i, seed in enumerate(self.seeds):
+            # same layout as model.random_level with the same seed
+            ships, planets, waypoints = model.random_layout(width, height,
+                padding, 1, n_planets, n_waypoints, random.Random(seed))
+            self.x[i], self.y[i] = ships[0][:2]
+            self.planets[i] = planets
+            self.waypoints[i] = waypoints
+        self.remaining = np.ones((count, n_waypoints), dtype=bool)
+        self.alive = np.ones(count, dtype=bool)
+        self.fuel = np.zeros(count, dtype=np.int64)
+        self.ticks = np.zeros(count, dtype=np.int64)
+    @property
+    def done(self):
+        return ~self.alive | ~self.remaining.any(axis=1)
+    def step(self, steps=1):
+        index = np.flatnonzero(~self.done)
+        if not len(index):
+            return
+        if self.policy:
+            # thrust is held for the whole step, as in the game
+            tx, ty = self.policy(self)
+            tx, ty = tx[index], ty[index]
+            self.fx[index] = tx * model.Ship.POWER
+            self.fy[index] = ty * model.Ship.POWER
+            thrusting = (tx != 0) | (ty != 0)
+            self.fuel[index] += thrusting * steps * self.dt
+        for i in range(steps):
+            self.tick(index)
+            index = index[~self.done[index]]
+            if not len(index):
+                break
+    def tick(self, index):
+        # semi-implicit euler for the ships of the given levels, followed by
+        # collisions against the planets and waypoints of each level
+        dt = self.dt
+        x, y = self.x[index], self.y[index]
+        planets = self.planets[index]
+        dx = planets[:, :, 0] - x[:, None]
+        dy = planets[:, :, 1] - y[:, None]
+        d2 = dx * dx + dy * dy
+        f = physics.G * planets[:, :, 2] ** 3 / (d2 * np.sqrt(d2))
+        self.dx[index] += ((f * dx).sum(axis=1) + self.fx[index]) * dt
+        self.dy[index] += ((f * dy).sum(axis=1) + self.fy[index]) * dt
+        self.x[index] += self.dx[index] * dt
+        self.y[index] += self.dy[index] * dt
+        self.ticks[index] += dt
+        x, y = self.x[index, None], self.y[index, None]
+        r = model.Ship.RADIUS
+        crashed = (np.hypot(planets[:, :, 0] - x, planets[:, :, 1] - y) <
+            planets[:, :, 2] + r).any(axis=1)
+        waypoints = self.waypoints[index]
+        collected = np.hypot(waypoints[:, :, 0] - x, waypoints[:, :, 1] - y) < (
+            waypoints[:, :, 2] + r)
+        collected &= ~crashed[:, None]
+        self.alive[index] &= ~crashed
+        self.remaining[index] &= ~collected
+    def run(self, ticks, steps=16):
+        # levels still going after the given number of ticks are left there
+        for tick in range(0, ticks, steps * self.dt):
+            if self.done.all():
+                break
+            self.step(steps)
+    def results(self):
+        results = np.zeros((len(self.seeds), len(RESULTS)))
+        results[:, 0] = self.ticks
+        results[:, 1] = self.fuel
+        results[:, 2] = ~self.alive
+        results[:, 3] = self.remaining.sum(axis=1)
+        return results
+        
+def idle(batch):
+    zeros = np.zeros(len(batch.x), dtype=int)
+    return zeros, zeros
+    
+def seek(batch, speed=0.15, slack=0.02):
+    # head for the closest waypoint left at a modest speed, thrusting along
+    # each axis where the velocity is off by more than the slack
+    waypoints = batch.waypoints
+    dx = waypoints[:, :, 0] - batch.x[:, None]
+    dy = waypoints[:, :, 1] - batch.y[:, None]
+    d2 = np.where(batch.remaining, dx * dx + dy * dy, np.inf)
+    closest = d2.argmin(axis=1)
+    rows = np.arange(len(closest))
+    dx, dy = dx[rows, closest], dy[rows, closest]
+    d = np.hypot(dx, dy)
+    d[d == 0] = 1
+    ex = dx / d * speed - batch.dx
+    ey = dy / d * speed - batch.dy
+    tx = np.where(np.abs(ex) > slack, np.sign(ex), 0).astype(int)
+    ty = np.where(np.abs(ey) > slack, np.sign(ey), 0).astype(int)
+    return tx, ty
+    
+POLICIES = {
+    'idle': idle,
+    'seek': seek,
+}
+
+# results array shared with the worker processes
+shared = None
+
+def init_worker(results):
+    global shared
+    shared = np.frombuffer(results).reshape(-1, len(RESULTS))
+    
+def run_chunk(job):
+    # workers write straight into the shared results, nothing is sent back
+    offset, seeds, policy, ticks, steps = job
+    batch = Batch(seeds, POLICIES[policy])
+    batch.run(ticks, steps)
+    shared[offset:offset + len(seeds)] = batch.results()
+    
+def run(seeds, policy='seek', ticks=60000, steps=16, processes=None, chunk=256):
+    # levels are split into chunks, each chunk is one vectorized batch
+    seeds = list(seeds)
+    results = multiprocessing.RawArray('d', len(seeds) * len(RESULTS))
+    jobs = [(i, seeds[i:i + chunk], policy, ticks, steps)
+        for i in range(0, len(seeds), chunk)]
+    if processes == 1:
+        init_worker(results)
+        for job in jobs:
+            run_chunk(job)
+    else:
+        pool = multiprocessing.Pool(processes, init_worker, (results,))
+        pool.map(run_chunk, jobs)
+        pool.close()
+        pool.join()
+    return np.frombuffer(results).reshape(-1, len(RESULTS))
+    
+def summary(results):
+    ticks, fuel, crashed, waypoints = results.T
+    completed = (waypoints == 0) & (crashed == 0)
+    return {
+        'levels': len(results),
+        'completion_rate': completed.mean() if len(results) else 0.0,
+        'crash_rate': crashed.mean() if len(results) else 0.0,
+        'mean_time': ticks[completed].mean() / 1000 if completed.any() else None,
+        'mean_fuel': fuel.mean() if len(results) else 0.0,
+        'mean_waypoints_left': waypoints.mean() if len(results) else 0.0,
+    }
+    
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run many random levels with a scripted policy.')
+    parser.add_argument('--levels', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0,
+        help='seed of the first level, the others follow on')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='seek')
+    parser.add_argument('--ticks', type=int, default=60000,
+        help='time limit per level in milliseconds')
+    parser.add_argument('--steps', type=int, default=16,
+        help='physics steps between policy decisions')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    seeds = range(args.seed, args.seed + args.levels)
+    results = run(seeds, args.policy, args.ticks, args.steps, args.processes)
+    print(json.dumps(summary(results), indent=2, sort_keys=True))
+    
+if __name__ == '__main__':
+    main()
+    
+    
\ No newline at end of file
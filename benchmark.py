@@ -0,0 +1,147 @@
+import argparse
+import headless
+import json
+import model
+import numpy as np
+import parallel
+import physics
+import profiler
+import quadtree
+import random
+import timeit
+import util
+
+# step length used with each integrator, in milliseconds
+STEP_LENGTHS = {
+    'euler': 1,
+    'verlet': 10,
+    'rk45': 50,
+}
+
+def memory_usage():
+    # peak resident set size in kilobytes, where available
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+def populate(level, count):
+    # extra ships scattered around the planets
+    xyrs = [planet.xyr for planet in level.planets]
+    while count > 0:
+        x = random.uniform(-headless.WIDTH, 2 * headless.WIDTH)
+        y = random.uniform(-headless.HEIGHT, 2 * headless.HEIGHT)
+        if util.min_xyr_spacing((x, y, 12), xyrs) < 0:
+            continue
+        level.ships.append(model.Ship(x, y))
+        count -= 1
+    level.finish()
+    
+def measure(bodies, integrator, steps, theta=None, seed=0, workers=1):
+    random.seed(seed)
+    level = headless.create_level()
+    populate(level, max(0, bodies - len(level.bodies)))
+    level.integrator = integrator
+    level.dt = STEP_LENGTHS[integrator]
+    error = None
+    if theta is not None:
+        level.solver = quadtree.Solver(theta)
+        # force error of the tree against direct summation on the bodies
+        # at the start of the run
+        np.random.seed(seed)
+        system = level.system
+        rms, worst = level.solver.error(system.x, system.y, system.mass)
+        error = {'rms': rms, 'max': worst}
+    if workers > 1:
+        level.solver = parallel.Solver(workers, level.solver)
+    # the field is built on first use, not in the first measured step.
+    # smaller levels sum the planets directly and never build it
+    if len(level.planets) * len(level.ships) >= physics.FIELD_PAIRS:
+        level.field
+    runner = headless.Runner(level)
+    profiler.reset()
+    latencies = []
+    try:
+        for i in range(steps):
+            start = timeit.default_timer()
+            runner.step()
+            latencies.append(timeit.default_timer() - start)
+            profiler.frame()
+    finally:
+        if workers > 1:
+            level.solver.close()
+    latencies = np.array(latencies) * 1000
+    total = latencies.sum() / 1000
+    return {
+        'bodies': bodies,
+        'integrator': integrator,
+        'workers': workers,
+        'dt': level.dt,
+        'theta': theta,
+        'force_error': error,
+        'steps': steps,
+        'steps_per_second': steps / total,
+        'ticks_per_second': runner.ticks / total,
+        'latency_ms': {
+            'p50': np.percentile(latencies, 50),
+            'p90': np.percentile(latencies, 90),
+            'p99': np.percentile(latencies, 99),
+            'max': latencies.max(),
+        },
+        'memory_kb': memory_usage(),
+        'bodies_left': len(level.bodies),
+        'profile': profiler.summary() if profiler.enabled else None,
+    }
+    
+def scaling(results):
+    # speedup and efficiency of each run against the single worker run
+    # with the same settings
+    keys = ('bodies', 'integrator', 'theta', 'steps')
+    serial = {}
+    for result in results:
+        if result['workers'] == 1:
+            serial[tuple(result[key] for key in keys)] = result
+    for result in results:
+        base = serial.get(tuple(result[key] for key in keys))
+        if base:
+            speedup = result['ticks_per_second'] / base['ticks_per_second']
+            result['speedup'] = speedup
+            result['efficiency'] = speedup / result['workers']
+            
+def main():
+    parser = argparse.ArgumentParser(description='Headless physics benchmark.')
+    parser.add_argument('--bodies', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--integrators', nargs='+', default=sorted(STEP_LENGTHS))
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--theta', type=float, default=None)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+        help='threads computing forces, the runs are compared with 1')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--profile', action='store_true',
+        help='add per-subsystem timings and counters to the results')
+    args = parser.parse_args()
+    profiler.enabled = args.profile
+    results = []
+    for bodies in args.bodies:
+        for integrator in args.integrators:
+            for workers in args.workers:
+                result = measure(bodies, integrator, args.steps, args.theta,
+                    workers=workers)
+                results.append(result)
+    scaling(results)
+    for result in results:
+        line = '%6d bodies %-7s %2d workers %10.1f ticks/s p99 %.3f ms' % (
+            result['bodies'], result['integrator'], result['workers'],
+            result['ticks_per_second'], result['latency_ms']['p99'])
+        if 'efficiency' in result:
+            line += ' efficiency %.2f' % result['efficiency']
+        if result['force_error']:
+            line += ' force error rms %.2e max %.2e' % (
+                result['force_error']['rms'], result['force_error']['max'])
+        print(line)
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+        
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+class Clock(object):
+    # fixed timestep accumulator, frame time is converted into whole
+    # simulation steps and the remainder is carried over to the next frame
+    def __init__(self, step=0.001, max_steps=100):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.ticks = 0
+    @property
+    def time(self):
+        return self.ticks * self.step
+    @property
+    def alpha(self):
+        return self.accumulator / self.step
+    def advance(self, dt):
+        self.accumulator += dt
+        steps = int(self.accumulator / self.step)
+        if steps > self.max_steps:
+            # too far behind, drop the backlog instead of spiralling
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
+        self.ticks += steps
+        return steps
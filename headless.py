@@ -0,0 +1,34 @@
+import model
+
+WIDTH = 960
+HEIGHT = 640
+
+def create_level(seed=None):
+    # same layout the game uses, without any graphics
+    return model.random_level(WIDTH, HEIGHT, 25, 1, 5, 5, seed)
+    
+class Runner(object):
+    # steps a level the way the window does, thrust comes from a policy
+    # function called with the level and each ship
+    def __init__(self, level, policy=None):
+        self.level = level
+        self.policy = policy
+        self.ticks = 0
+        self.elapsed = 0
+    @property
+    def done(self):
+        return not self.level.ships or not self.level.waypoints
+    def step(self, steps=1):
+        level = self.level
+        ticks = steps * level.dt
+        if self.policy:
+            for ship in level.ships:
+                ship.thrust(*self.policy(level, ship), steps=ticks)
+        level.update(steps)
+        self.ticks += ticks
+        if not self.done:
+            self.elapsed = self.ticks
+    def run(self, ticks, steps=1):
+        while self.ticks < ticks and not self.done:
+            self.step(steps)
+        return self.elapsed
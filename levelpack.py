@@ -0,0 +1,160 @@
+import argparse
+import mmap
+import model
+import numpy as np
+import route
+import struct
+import timeit
+
+MAGIC = b'GLP1'
+
+# magic, number of levels
+HEADER = struct.Struct('<4sI')
+
+# one entry per level after the header, where its records start, how many
+# of each there are and what's known about the level
+INDEX = np.dtype([
+    ('offset', '<u8'),
+    ('seed', '<u4'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('ships', '<u2'),
+    ('planets', '<u2'),
+    ('waypoints', '<u2'),
+    ('par_time', '<f4'),
+    ('par_fuel', '<f4'),
+    ('difficulty', '<f4'),
+])
+
+# the records of a level follow each other, ships then planets then
+# waypoints. positions are kept as doubles so a level loads exactly as it
+# was generated, image is an index into model.PLANETS
+SHIP = np.dtype([('x', '<f8'), ('y', '<f8')])
+PLANET = np.dtype([('x', '<f8'), ('y', '<f8'), ('r', '<f8'),
+    ('image', 'u1'), ('rotation', '<u2')])
+WAYPOINT = np.dtype([('x', '<f8'), ('y', '<f8'), ('r', '<f8')])
+
+class Record(object):
+    # one level of a pack, the arrays are views onto the file
+    def __init__(self, entry, ships, planets, waypoints):
+        self.seed = int(entry['seed'])
+        self.width = int(entry['width'])
+        self.height = int(entry['height'])
+        self.par_time = float(entry['par_time'])
+        self.par_fuel = float(entry['par_fuel'])
+        self.difficulty = float(entry['difficulty'])
+        self.ships = ships
+        self.planets = planets
+        self.waypoints = waypoints
+    def level(self):
+        return model.record_level(self)
+        
+class Writer(object):
+    # collects levels and writes them out as one pack
+    def __init__(self):
+        self.entries = []
+        self.records = []
+    def add(self, level, width, height, par_time=float('inf'),
+            par_fuel=float('inf'), difficulty=0.0):
+        ships = [ship.xyr[:2] for ship in level.ships]
+        planets = [planet.xyr + (model.PLANETS.index(planet.image), planet.rotation)
+            for planet in level.planets]
+        waypoints = [waypoint.xyr for waypoint in level.waypoints]
+        records = (np.array(ships, dtype=SHIP), np.array(planets, dtype=PLANET),
+            np.array(waypoints, dtype=WAYPOINT))
+        self.entries.append((0, level.seed or 0, width, height,
+            len(level.ships), len(level.planets), len(level.waypoints),
+            par_time, par_fuel, difficulty))
+        self.records.append(b''.join(array.tobytes() for array in records))
+    def dumps(self):
+        index = np.array(self.entries, dtype=INDEX)
+        offsets = np.cumsum([0] + [len(records) for records in self.records[:-1]])
+        index['offset'] = HEADER.size + index.nbytes + offsets
+        header = HEADER.pack(MAGIC, len(index))
+        return b''.join([header, index.tobytes()] + self.records)
+    def save(self, path):
+        with open(path, 'wb') as fp:
+            fp.write(self.dumps())
+            
+class Pack(object):
+    # a level pack opened with mmap, the index is read in place and a level
+    # only touches its own records, so opening a pack and loading any level
+    # by index take the same time however many levels there are
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('not a level pack')
+        self.index = np.frombuffer(self.data, INDEX, count, HEADER.size)
+    def __len__(self):
+        return len(self.index)
+    def __getitem__(self, i):
+        entry = self.index[i]
+        offset = int(entry['offset'])
+        arrays = []
+        for dtype, name in ((SHIP, 'ships'), (PLANET, 'planets'), (WAYPOINT, 'waypoints')):
+            count = int(entry[name])
+            arrays.append(np.frombuffer(self.data, dtype, count, offset))
+            offset += count * dtype.itemsize
+        return Record(entry, *arrays)
+    def level(self, i):
+        return self[i].level()
+    def close(self):
+        # views from __getitem__ keep the map open until they're gone
+        self.index = None
+        try:
+            self.data.close()
+        except BufferError:
+            pass
+        self.file.close()
+        
+def main():
+    parser = argparse.ArgumentParser(description='Build a pack of random levels.')
+    parser.add_argument('path')
+    parser.add_argument('--levels', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=960)
+    parser.add_argument('--height', type=int, default=640)
+    parser.add_argument('--planets', type=int, default=5)
+    parser.add_argument('--waypoints', type=int, default=5)
+    parser.add_argument('--par', action='store_true',
+        help='work out par time and fuel with the route solver, slow')
+    args = parser.parse_args()
+    writer = Writer()
+    start = timeit.default_timer()
+    for seed in range(args.seed, args.seed + args.levels):
+        level = model.random_level(args.width, args.height, 25, 1,
+            args.planets, args.waypoints, seed)
+        if args.par:
+            solution = route.solve(level)
+            # share of the flight spent thrusting, nothing to fly is easy
+            if not solution.ticks:
+                difficulty = 0.0
+            elif np.isfinite(solution.ticks):
+                difficulty = solution.fuel / solution.ticks
+            else:
+                difficulty = float('inf')
+            writer.add(level, args.width, args.height,
+                solution.par_time, solution.par_fuel, difficulty)
+        else:
+            writer.add(level, args.width, args.height)
+    writer.save(args.path)
+    built = timeit.default_timer() - start
+    start = timeit.default_timer()
+    pack = Pack(args.path)
+    opened = timeit.default_timer() - start
+    rng = np.random.RandomState(args.seed)
+    picks = rng.randint(0, len(pack), 100)
+    start = timeit.default_timer()
+    for i in picks:
+        pack.level(i)
+    loaded = (timeit.default_timer() - start) / len(picks)
+    pack.close()
+    print('%d levels built in %.1f s, opened in %.2f ms, %.2f ms per level loaded' % (
+        args.levels, built, opened * 1000, loaded * 1000))
+        
+if __name__ == '__main__':
+    main()
+    
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import json
+import random
+import server
+
+def wander(seed):
+    # holds a random thrust for a while, then picks another
+    rng = random.Random(seed)
+    thrust = [(0, 0)]
+    def policy(client):
+        if rng.random() < 0.05:
+            thrust[0] = (rng.randint(-1, 1), rng.randint(-1, 1))
+        return thrust[0]
+    return policy
+    
+async def measure(players, seconds, seed, radius):
+    # one server and its loopback clients sharing an event loop
+    game = server.Server(seed, radius=radius)
+    listener = await asyncio.start_server(game.handle, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = []
+    for i in range(players):
+        client = server.Client(wander(seed + i))
+        await client.connect('127.0.0.1', port)
+        clients.append(client)
+    readers = [asyncio.ensure_future(client.run()) for client in clients]
+    await game.run(seconds)
+    for client in clients:
+        client.close()
+    await asyncio.gather(*readers)
+    listener.close()
+    await listener.wait_closed()
+    visible = sum(len(client.ships) for client in clients) / float(players)
+    return {
+        'players': players,
+        'ticks_per_second': game.ticks / float(seconds),
+        'ms_per_frame': game.busy / game.frames * 1000,
+        'bytes_per_player_per_second': sum(
+            client.bytes for client in clients) / float(players * seconds),
+        'visible_ships': visible,
+    }
+    
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test of the multiplayer server over loopback.')
+    parser.add_argument('--players', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--radius', type=int, default=640)
+    parser.add_argument('--output', default='loadtest.json')
+    args = parser.parse_args()
+    results = []
+    for players in args.players:
+        result = asyncio.run(measure(players, args.seconds, args.seed, args.radius))
+        results.append(result)
+        print('%4d players %7.0f ticks/s %6.2f ms/frame %8.0f bytes/s per player %5.1f visible' % (
+            players, result['ticks_per_second'], result['ms_per_frame'],
+            result['bytes_per_player_per_second'], result['visible_ships']))
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+        
+if __name__ == '__main__':
+    main()
+    
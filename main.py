@@ -1,14 +1,32 @@
 from pyglet.gl import *
 from pyglet.window import key
+import assets
+import clock
 import model
 import overlay
+import os
+import predict
+import profiler
 import pyglet
-import time
+import replay
+import sys
 import util
+import view
 
 WIDTH = 960
 HEIGHT = 640
 
+# size of the generated levels, the camera follows the ship around
+# levels bigger than the window
+WORLD_WIDTH = WIDTH
+WORLD_HEIGHT = HEIGHT
+
+# finished runs are saved here for replay
+REPLAYS = 'replays'
+
+# frame timings are written here when profiling is switched off
+PROFILE = 'profile.csv'
+
 KEY_MAPPING = {
     key.UP: (0, 1),
     key.DOWN: (0, -1),
@@ -18,20 +36,58 @@ KEY_MAPPING = {
 
 class Window(pyglet.window.Window):
     def __init__(self, *args, **kwargs):
+        # exits after the first frame, to time startup
+        self.startup = kwargs.pop('startup', False)
         super(Window, self).__init__(*args, **kwargs)
+        self.view = None
+        self.predictor = None
+        self.fuel_label = pyglet.text.Label('', x=WIDTH-10-25, y=HEIGHT-10-25, font_size=18, bold=True, anchor_x='right', anchor_y='top')
+        self.time_label = pyglet.text.Label('', x=10+25, y=HEIGHT-10-25, font_size=18, bold=True, anchor_y='top')
+        self.profile_label = None
         self.reset()
         self.thrusts = set()
-        self.mask1 = self.load_mask('images/mask1.jpg', 48)
-        self.mask2 = self.load_mask('images/mask2.png', 64)
+        # the masks and the rest of the sprites are loaded a little at a
+        # time once the window is up, whatever a level needs first is
+        # loaded on demand
+        self.mask1 = None
+        self.mask2 = None
+        self.preload = assets.image_paths()
+        pyglet.clock.schedule(self.load_next)
         pyglet.clock.schedule(self.update)
+        pyglet.clock.schedule(self.update_effects)
+        pyglet.clock.schedule_interval(self.update_profile, 0.5)
+    def load_next(self, dt):
+        if self.mask1 is None:
+            self.mask1 = self.load_mask('images/mask1.jpg', 48)
+        elif self.mask2 is None:
+            self.mask2 = self.load_mask('images/mask2.png', 64)
+        elif self.preload:
+            assets.load_image(self.preload.pop(0))
+        else:
+            pyglet.clock.unschedule(self.load_next)
     def reset(self):
-        self.level = model.random_level(WIDTH, HEIGHT, 25, 1, 5, 5)
+        self.level = model.random_level(WORLD_WIDTH, WORLD_HEIGHT, 25, 1, 5, 5)
         #self.level = model.level1()
-        # gravity overlay
-        bodies = [planet.body for planet in self.level.planets]
-        self.overlay = None#overlay.gravity_map(bodies, (0, 0, WIDTH, HEIGHT), 8)
+        if self.view:
+            self.view.delete()
+        self.view = view.LevelView(self.level, WIDTH, HEIGHT)
+        # flight path prediction, worked out on a background thread
+        if self.predictor:
+            self.predictor.stop()
+        self.predictor = predict.Predictor(self.level.planet_bodies, self.level.dt,
+            radius=model.Ship.RADIUS)
+        self.predictor.start()
+        # gravity overlay, worked out in the background and shown once ready
+        self.overlay = None
+        overlay.prepare(self.level.planet_bodies, (0, 0, WORLD_WIDTH, WORLD_HEIGHT))
+        self.start = self.level.snapshot()
+        self.retry()
+    def retry(self):
+        # back to the start of the same level, without rebuilding it
+        self.level.restore(self.start)
+        self.recorder = replay.Recorder(self.level, WORLD_WIDTH, WORLD_HEIGHT, 25, 1, 5, 5)
         self.elapsed = 0
-        self.start_time = time.clock()
+        self.clock = clock.Clock(0.001 * self.level.dt)
     def load_mask(self, path, opacity):
         image = pyglet.image.load(path)
         sprite = pyglet.sprite.Sprite(image)
@@ -39,45 +95,104 @@ class Window(pyglet.window.Window):
         return sprite
     def get_ship(self):
         return self.level.ships[0] if self.level.ships else None
+    def update_effects(self, dt):
+        if view.effects:
+            with profiler.timer('particles'):
+                view.effects.update(dt)
+    def update_profile(self, dt):
+        if profiler.enabled and self.profile_label:
+            self.set_text(self.profile_label, profiler.text())
     def update(self, dt):
-        # tick for each millisecond elapsed
-        millis = int(round(dt * 1000))
-        for i in range(millis):
-            self.level.update()
-            # apply ship thrust
-            ship = self.get_ship()
-            if ship:
-                ship.thrust(*util.sum_coords(self.thrusts))
-            # update elapsed time
-            if ship and self.level.waypoints:
-                self.elapsed = time.clock() - self.start_time
+        with profiler.timer('update'):
+            self.update_simulation(dt)
+    def update_simulation(self, dt):
+        # advance the simulation in whole physics steps
+        steps = self.clock.advance(dt)
+        if not steps:
+            return
+        # apply ship thrust
+        dx, dy = util.sum_coords(self.thrusts)
+        ship = self.get_ship()
+        if ship:
+            ship.thrust(dx, dy, steps=steps * self.level.dt)
+        self.level.update(steps)
+        ship = self.get_ship()
+        if ship:
+            body = ship.body
+            self.predictor.post((body.x, body.y, body.dx, body.dy), (body.fx, body.fy))
+        # update elapsed time
+        if ship and self.level.waypoints:
+            self.elapsed += steps * self.clock.step
+        # record the run until it is over
+        if self.recorder:
+            self.recorder.record(steps, dx, dy)
+            if not ship or not self.level.waypoints:
+                self.save_replay()
+    def save_replay(self):
+        if not os.path.exists(REPLAYS):
+            os.makedirs(REPLAYS)
+        path = os.path.join(REPLAYS, '%d.replay' % self.level.seed)
+        self.recorder.save(path)
+        self.recorder = None
     def on_draw(self):
         self.clear()
+        if self.overlay is None:
+            self.overlay = overlay.gravity_map(self.level.planet_bodies,
+                (0, 0, WORLD_WIDTH, WORLD_HEIGHT), wait=False)
         if self.overlay:
-            self.overlay.blit(0, 0)
-        self.mask1.draw()
-        self.level.draw()
-        self.mask2.draw()
-        # Fuel Label
+            self.overlay.blit(*self.view.offset)
+        if self.mask1:
+            self.mask1.draw()
         ship = self.get_ship()
+        self.view.path.update(self.predictor.points if ship else ())
+        self.view.draw(self.clock.alpha)
+        if self.mask2:
+            self.mask2.draw()
+        # Fuel Label
         fuel_usage = ship.fuel_usage if ship else 0
-        label = pyglet.text.Label('Fuel: %d' % fuel_usage, x=WIDTH-10-25, y=HEIGHT-10-25, font_size=18, bold=True, anchor_x='right', anchor_y='top')
-        label.draw()
+        self.set_text(self.fuel_label, 'Fuel: %d' % fuel_usage)
+        self.fuel_label.draw()
         # Time Label
-        label = pyglet.text.Label('Time: %.1f' % self.elapsed, x=10+25, y=HEIGHT-10-25, font_size=18, bold=True, anchor_y='top')
-        label.draw()
+        self.set_text(self.time_label, 'Time: %.1f' % self.elapsed)
+        self.time_label.draw()
+        # Profile Overlay
+        if profiler.enabled and self.profile_label:
+            self.profile_label.draw()
+        profiler.frame()
+        if self.startup:
+            print('first frame')
+            sys.stdout.flush()
+            pyglet.app.exit()
+    def set_text(self, label, text):
+        # relayout only when the text actually changes
+        if label.text != text:
+            label.text = text
     def on_key_press(self, symbol, modifiers):
         if symbol in KEY_MAPPING:
             self.thrusts.add(KEY_MAPPING[symbol])
         if symbol == key.SPACE:
             self.reset()
+        if symbol == key.R:
+            self.retry()
+        if symbol == key.P:
+            self.toggle_profiler()
+    def toggle_profiler(self):
+        profiler.enabled = not profiler.enabled
+        if profiler.enabled:
+            profiler.reset()
+            if self.profile_label is None:
+                self.profile_label = pyglet.text.Label('', x=10+25, y=10+25, width=WIDTH, multiline=True, font_name='Courier New', font_size=10)
+            self.set_text(self.profile_label, '')
+        else:
+            profiler.export(PROFILE)
     def on_key_release(self, symbol, modifiers):
         if symbol in KEY_MAPPING:
             self.thrusts.discard(KEY_MAPPING[symbol])
             
 def main():
-    window = Window(width=WIDTH, height=HEIGHT, caption='Gravity')
-    util.enable_alpha()
+    startup = '--startup' in sys.argv
+    window = Window(width=WIDTH, height=HEIGHT, caption='Gravity', startup=startup)
+    view.enable_alpha()
     pyglet.app.run()
     
 if __name__ == '__main__':
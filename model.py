@@ -1,7 +1,10 @@
-from pyglet.gl import *
-import math
+import numpy as np
 import physics
+import poisson
+import profiler
 import random
+import spatial
+import struct
 import util
 
 PLANETS = [
@@ -13,136 +16,43 @@ PLANETS = [
     'images/io.png',
 ]
 
-class Group(pyglet.graphics.OrderedGroup):
-    def __init__(self, *args, **kwargs):
-        super(Group, self).__init__(*args, **kwargs)
-        self.dx = 0
-        self.dy = 0
-    def set_state(self):
-        glPushMatrix()
-        glTranslatef(self.dx, self.dy, 0)
-    def unset_state(self):
-        glPopMatrix()
-        
-batch = pyglet.graphics.Batch()
-background = Group(0)
-planets = Group(1)
-waypoints = Group(2)
-ships = Group(3)
-pointers = Group(4)
+THRUST_ROTATIONS = {
+    (0, 1): 0,
+    (1, 1): 45,
+    (1, 0): 90,
+    (1, -1): 135,
+    (0, -1): 180,
+    (-1, -1): 225,
+    (-1, 0): 270,
+    (-1, 1): 315,
+}
 
-class WaypointHit(object):
-    def __init__(self, x, y):
-        image = util.load_image('images/star_blue.png')
-        self.t = 0
-        self.x = x
-        self.y = y
-        sprites = []
-        for angle in range(10):
-            sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=waypoints)
-            sprite._angle = random.randint(0, 359)
-            sprite._speed = random.randint(20, 100)
-            sprite._rot = random.randint(0, 359)
-            sprite._mul = random.randint(-360, 360)
-            sprites.append(sprite)
-        self.sprites = sprites
-        self.update(0)
-    def update(self, dt):
-        self.t += dt
-        t = self.t
-        for sprite in self.sprites:
-            sprite.opacity = max(0, int(255 - 255 * t))
-            sprite.scale = t / 16
-            sprite.rotation = sprite._rot + t * sprite._mul
-            d = t * sprite._speed
-            sprite.x = self.x + math.cos(math.radians(sprite._angle)) * d
-            sprite.y = self.y + math.sin(math.radians(sprite._angle)) * d
-        if t < 1:
-            pyglet.clock.schedule_once(self.update, 0)
-        else:
-            for sprite in self.sprites:
-                sprite.delete()
-                
-class PlanetHit(object):
-    def __init__(self, x, y):
-        image = util.load_image('images/smoke.png')
-        self.t = 0
-        self.x = x
-        self.y = y
-        sprites = []
-        for angle in range(10):
-            sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=waypoints)
-            sprite._angle = random.randint(0, 359)
-            sprite._speed = random.randint(0, 50)
-            sprite._rot = random.randint(0, 359)
-            sprite._mul = random.randint(-180, 180)
-            sprites.append(sprite)
-        self.sprites = sprites
-        self.update(0)
-    def update(self, dt):
-        self.t += dt
-        t = self.t
-        for sprite in self.sprites:
-            sprite.opacity = max(0, int(255 - 255 * t))
-            sprite.scale = t / 4
-            sprite.rotation = sprite._rot + t * sprite._mul
-            d = t * sprite._speed
-            sprite.x = self.x + math.cos(math.radians(sprite._angle)) * d
-            sprite.y = self.y + math.sin(math.radians(sprite._angle)) * d
-        if t < 1:
-            pyglet.clock.schedule_once(self.update, 0)
-        else:
-            for sprite in self.sprites:
-                sprite.delete()
-                
 class Ship(object):
+    RADIUS = 12
+    POWER = 1e-4
     def __init__(self, x, y):
-        image_on = util.load_image('images/ship2-on.png')
-        image_off = util.load_image('images/ship2-off.png')
-        self.sprite_on = pyglet.sprite.Sprite(image_on, x=x, y=y, batch=batch, group=ships)
-        self.sprite_off = pyglet.sprite.Sprite(image_off, x=x, y=y, batch=batch, group=ships)
-        self.sprite = self.sprite_off
-        self.body = physics.Body(x, y, 12, fixed=False)
+        self.body = physics.Body(x, y, self.RADIUS, fixed=False)
         self.fuel_usage = 0
-    def thrust(self, dx, dy):
-        # set sprite
-        if dx or dy:
-            self.sprite_on.visible = True
-            self.sprite_off.visible = False
-            self.fuel_usage += 1
-        else:
-            self.sprite_on.visible = False
-            self.sprite_off.visible = True
-        # update body
-        power = 1e-4
-        fx = dx * power
-        fy = dy * power
-        self.body.force(fx, fy)
+        self.thrusting = False
+        self.rotation = 0
+    def thrust(self, dx, dy, steps=1):
+        self.thrusting = bool(dx or dy)
+        if self.thrusting:
+            self.fuel_usage += steps
+        # update body, applied on every physics step until changed
+        self.body.fx = dx * self.POWER
+        self.body.fy = dy * self.POWER
         # set rotation
-        mapping = {
-            (0, 1): 0,
-            (1, 1): 45,
-            (1, 0): 90,
-            (1, -1): 135,
-            (0, -1): 180,
-            (-1, -1): 225,
-            (-1, 0): 270,
-            (-1, 1): 315,
-        }
-        if (dx, dy) in mapping:
-            rotation = mapping[(dx, dy)]
-            self.sprite_on.rotation = rotation
-            self.sprite_off.rotation = rotation
+        if (dx, dy) in THRUST_ROTATIONS:
+            self.rotation = THRUST_ROTATIONS[(dx, dy)]
     @property
     def xyr(self):
         return self.body.xyr
         
 class Planet(object):
-    def __init__(self, x, y, r):
-        image = util.load_image(random.choice(PLANETS))
-        self.sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=planets)
-        self.sprite.scale = float(r) / (image.width / 2)
-        self.sprite.rotation = random.randint(0, 359)
+    def __init__(self, x, y, r, rng=random, image=None, rotation=None):
+        self.image = rng.choice(PLANETS) if image is None else image
+        self.rotation = rng.randint(0, 359) if rotation is None else rotation
         self.body = physics.Body(x, y, r)
     @property
     def xyr(self):
@@ -150,184 +60,305 @@ class Planet(object):
         
 class Waypoint(object):
     def __init__(self, x, y, r):
+        self.x = x
+        self.y = y
         self.r = r
-        #image = util.load_image('images/waypoint.png')
-        image = util.load_animation('images/waypoint', 0.01, 0.5)
-        self.sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=waypoints)
-    def __del__(self):
-        self.sprite.delete()
     @property
     def xyr(self):
-        return (self.sprite.x, self.sprite.y, self.r)
+        return (self.x, self.y, self.r)
         
 class Level(object):
+    # the planets, waypoints and ships of a level. entities added or removed
+    # after finish() go through add() and remove(), which update the physics
+    # arrays and the collision hash in place and send on_add and on_remove
+    # to the handlers, nothing is rebuilt. each entity's place in its list
+    # and in the roster is kept in a dict, so neither scans a list
     def __init__(self):
         self.ships = []
         self.planets = []
         self.waypoints = []
-        self.stars = create_stars(200, 4, 14)
-        self.offset = (0, 0)
-    def clear_cache(self):
-        if hasattr(self, '_entities'):
-            del self._entities
-        if hasattr(self, '_bodies'):
-            del self._bodies
-        if hasattr(self, '_sprites'):
-            del self._sprites
+        self.handlers = []
+        self.roster = ([], [])
+        self.roster_index = {}
+        self.slots = {}
+        self.seed = None
+        self.solver = None
+        # physics step length in milliseconds and integration scheme
+        self.dt = 1
+        self.integrator = 'euler'
+        self.system = physics.bind([])
+        self.broadphase = spatial.SpatialHash()
+        self._field = None
+        self._ship_index = None
+    def push_handlers(self, handler):
+        self.handlers.append(handler)
+    def remove_handlers(self, handler):
+        self.handlers.remove(handler)
+    def dispatch_event(self, name, *args):
+        for handler in self.handlers:
+            method = getattr(handler, name, None)
+            if method:
+                method(*args)
+    def finish(self):
+        # called once the entities are in place, snapshots refer to them
+        # by their index in the roster
+        self.roster = (list(self.ships), list(self.waypoints))
+        self.roster_index = {}
+        for roster in self.roster:
+            for i, entity in enumerate(roster):
+                self.roster_index[entity] = i
+        self.slots = {}
+        for entities in (self.ships, self.planets, self.waypoints):
+            self.update_slots(entities)
+        self.system = physics.bind(self.planet_bodies + [ship.body for ship in self.ships])
+        # planets and waypoints never move, they are hashed once
+        self.broadphase = spatial.SpatialHash()
+        for entity in self.planets + self.waypoints:
+            self.broadphase.add(entity, entity.xyr)
+        self._ship_index = None
+        # the field is built on first use, levels that are only looked at
+        # (packs, layouts) never pay for it
+        self._field = None
+    def entities_of(self, entity):
+        if isinstance(entity, Ship):
+            return self.ships
+        if isinstance(entity, Planet):
+            return self.planets
+        return self.waypoints
+    def update_slots(self, entities):
+        for i, entity in enumerate(entities):
+            self.slots[entity] = i
+    def add(self, entity):
+        entities = self.entities_of(entity)
+        self.slots[entity] = len(entities)
+        entities.append(entity)
+        if not isinstance(entity, Planet) and entity not in self.roster_index:
+            # a stable index for snapshots, kept if the entity comes back
+            roster = self.roster[0] if isinstance(entity, Ship) else self.roster[1]
+            self.roster_index[entity] = len(roster)
+            roster.append(entity)
+        if hasattr(entity, 'body'):
+            self.system.add(entity.body)
+            self._ship_index = None
+        if not isinstance(entity, Ship):
+            self.broadphase.add(entity, entity.xyr)
+        if isinstance(entity, Planet):
+            self._field = None
+        self.dispatch_event('on_add', entity)
+    def remove(self, entity):
+        # the last entity of the list moves into the freed slot
+        entities = self.entities_of(entity)
+        slot = self.slots.pop(entity)
+        last = entities.pop()
+        if last is not entity:
+            entities[slot] = last
+            self.slots[last] = slot
+        if hasattr(entity, 'body'):
+            # another body may have moved into its place
+            self.system.remove(entity.body)
+            self._ship_index = None
+        if not isinstance(entity, Ship):
+            self.broadphase.remove(entity, entity.xyr)
+        if isinstance(entity, Planet):
+            self._field = None
+        self.dispatch_event('on_remove', entity)
     @property
     def entities(self):
-        if not hasattr(self, '_entities'):
-            self._entities = self.planets + self.waypoints + self.ships
-        return self._entities
+        return self.planets + self.waypoints + self.ships
     @property
     def bodies(self):
-        if not hasattr(self, '_bodies'):
-            self._bodies = [entity.body for entity in self.entities if hasattr(entity, 'body')]
-        return self._bodies
+        return self.system.bodies
+    @property
+    def planet_bodies(self):
+        return [planet.body for planet in self.planets]
     @property
-    def sprites(self):
-        if not hasattr(self, '_sprites'):
-            self._sprites = [entity.sprite for entity in self.entities]
-        return self._sprites
-    def update(self):
-        physics.update(self.bodies)
-        self.do_collisions()
-    def draw(self):
-        for ship in self.ships:
-            util.copy_coords(ship.sprite_on, ship.body)
-            util.copy_coords(ship.sprite_off, ship.body)
-            if 1:
-                left = 960 / 3
-                right = 960 - left
-                top = 640 / 3
-                bottom = 640 - top
-                dx, dy = self.offset
-                sx, sy = int(ship.body.x), int(ship.body.y)
-                if sx + dx < left:
-                    dx += left - sx - dx
-                if sx + dx > right:
-                    dx -= sx - right + dx
-                if sy + dy < top:
-                    dy += top - sy - dy
-                if sy + dy > bottom:
-                    dy -= sy - bottom + dy
-                self.offset = (dx, dy)
-                for group in [planets, waypoints, ships]:
-                    #group.dx = 960 / 2 - ship.body.x
-                    #group.dy = 640 / 2 - ship.body.y
-                    group.dx = dx
-                    group.dy = dy
-                for group in [background]:
-                    group.dx = dx / 8
-                    group.dy = dy / 8
-        pointers = self.create_pointers()
-        batch.draw()
-    def create_pointers(self):
-        sprites = []
-        image = util.load_image('images/pointer.png')
-        x, y = 50, 50
-        w, h = 960 - x * 2, 640 - y * 2
-        ox, oy = self.offset
-        for ship in self.ships:
-            sx, sy = ship.sprite.x, ship.sprite.y
-            for waypoint in self.waypoints:
-                wx, wy = waypoint.sprite.x, waypoint.sprite.y
-                dx, dy = wx - sx, wy - sy
-                angle = -math.degrees(math.atan2(dy, dx))
-                p2 = (int(sx + ox), int(sy + oy))
-                p1 = (int(wx + ox), int(wy + oy))
-                intersection = util.rectangle_segment_intersection(x, y, w, h, p1, p2)
-                if intersection:
-                    ix, iy = intersection
-                    sprite = pyglet.sprite.Sprite(image, x=ix, y=iy, batch=batch, group=pointers)
-                    sprite.rotation = angle
-                    sprites.append(sprite)
-        return sprites
-    def do_collisions(self):
-        for ship in self.ships:
-            for planet in self.planets:
-                if util.collide(ship.xyr, planet.xyr):
-                    self.on_planet_collision(ship, planet)
-            for waypoint in self.waypoints:
-                if util.collide(ship.xyr, waypoint.xyr):
-                    self.on_waypoint_collision(ship, waypoint)
+    def field(self):
+        if self._field is None:
+            self.build_field()
+        return self._field
+    def build_field(self):
+        self._field = physics.Field(self.planet_bodies)
+    @property
+    def ship_index(self):
+        # positions of the ship bodies in the physics system
+        if self._ship_index is None:
+            self._ship_index = np.array(
+                [ship.body.index for ship in self.ships], dtype=int)
+        return self._ship_index
+    def update(self, steps=1):
+        start = None
+        if self.ships:
+            index = self.ship_index
+            start = (self.system.x[index], self.system.y[index])
+        # small levels sum the planets directly, see physics.FIELD_PAIRS
+        field = None
+        if len(self.planets) * len(self.ships) >= physics.FIELD_PAIRS:
+            field = self.field
+        with profiler.timer('physics'):
+            self.system.update(field, self.solver, steps,
+                self.dt, self.integrator)
+        profiler.count('ticks', steps * self.dt)
+        with profiler.timer('collisions'):
+            self.do_collisions(start)
+    def do_collisions(self, start=None):
+        # ships are swept from their start positions, so fast ships and
+        # long steps can't skip over a planet or waypoint
+        if not self.ships:
+            return
+        ships = list(self.ships)
+        index = self.ship_index
+        system = self.system
+        x1, y1, r = system.x[index], system.y[index], system.r[index]
+        x0, y0 = start if start is not None else (x1, y1)
+        # circles around each swept path for the broad phase
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        cr = r + np.hypot(x1 - x0, y1 - y0) / 2
+        for i in np.flatnonzero(self.broadphase.candidates(cx, cy, cr)):
+            ship = ships[i]
+            a = (x0[i], y0[i], r[i])
+            b = (x1[i], y1[i], r[i])
+            for entity in self.broadphase.query((cx[i], cy[i], cr[i])):
+                profiler.count('collision_tests')
+                c = entity.xyr
+                if util.line_point_distance(a, b, c) >= r[i] + c[2]:
+                    continue
+                if isinstance(entity, Planet):
+                    self.on_planet_collision(ship, entity)
+                    break
+                self.on_waypoint_collision(ship, entity)
+    def snapshot(self):
+        ships, waypoints = self.roster
+        snapshot = Snapshot(len(ships), len(waypoints))
+        alive = set(self.ships)
+        snapshot.ships[:] = [ship in alive for ship in ships]
+        alive = set(self.waypoints)
+        snapshot.waypoints[:] = [waypoint in alive for waypoint in waypoints]
+        if self.ships:
+            # remove() reorders the ships, rows go by roster position
+            index = self.ship_index
+            rows = [self.roster_index[ship] for ship in self.ships]
+            for i, name in enumerate(Snapshot.BODY):
+                snapshot.bodies[rows, i] = getattr(self.system, name)[index]
+            snapshot.substep = self.system.substep or 0.0
+        for i, ship in enumerate(ships):
+            snapshot.fuel[i] = ship.fuel_usage
+            snapshot.rotation[i] = ship.rotation
+            snapshot.thrusting[i] = ship.thrusting
+        return snapshot
+    def restore(self, snapshot):
+        # puts the level back in place, the entity objects are reused and
+        # only the ships and waypoints that differ are added or removed
+        ships, waypoints = self.roster
+        n_ships, n_waypoints = len(snapshot.ships), len(snapshot.waypoints)
+        for entities, alive, roster in ((self.ships, snapshot.ships, ships[:n_ships]),
+                (self.waypoints, snapshot.waypoints, waypoints[:n_waypoints])):
+            wanted = [entity for entity, keep in zip(roster, alive) if keep]
+            keep, present = set(wanted), set(entities)
+            for entity in list(entities):
+                if entity not in keep:
+                    self.remove(entity)
+            for entity in wanted:
+                if entity not in present:
+                    self.add(entity)
+            # back in roster order
+            entities[:] = wanted
+            self.update_slots(entities)
+        self._ship_index = None
+        if self.ships:
+            index = self.ship_index
+            for i, name in enumerate(Snapshot.BODY):
+                getattr(self.system, name)[index] = snapshot.bodies[snapshot.ships, i]
+            self.system.substep = snapshot.substep or None
+        for i, ship in enumerate(ships[:n_ships]):
+            ship.fuel_usage = int(snapshot.fuel[i])
+            ship.rotation = int(snapshot.rotation[i])
+            ship.thrusting = bool(snapshot.thrusting[i])
     def on_planet_collision(self, ship, planet):
-        print ship, planet
-        self.ships.remove(ship)
-        self.clear_cache()
-        x1, y1 = ship.body.x, ship.body.y
-        x2, y2 = planet.body.x, planet.body.y
-        x = x1 + (x2 - x1) / 3
-        y = y1 + (y2 - y1) / 3
-        PlanetHit(x, y)
+        self.remove(ship)
+        self.dispatch_event('on_planet_collision', ship, planet)
     def on_waypoint_collision(self, ship, waypoint):
-        print ship, waypoint
-        self.waypoints.remove(waypoint)
-        self.clear_cache()
-        WaypointHit(waypoint.sprite.x, waypoint.sprite.y)
+        self.remove(waypoint)
+        self.dispatch_event('on_waypoint_collision', ship, waypoint)
         
-def create_stars(count, min_size, max_size):
-    sprites = []
-    image = util.load_image('images/star.png')
-    pad = 100
-    for i in range(count):
-        size = random.randint(min_size, max_size)
-        x = random.randint(0 - pad, 960 + pad)
-        y = random.randint(0 - pad, 640 + pad)
-        sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=background)
-        sprite.scale = float(size) / image.width
-        sprite.rotation = random.randint(0, 359)
-        p = float(size - min_size) / float(max_size - min_size)
-        sprite.opacity = (255 - 64) * p + 64
-        sprites.append(sprite)
-    return sprites
-    
-def random_level(width, height, padding, n_ships, n_planets, n_waypoints):
-    xyrs = []
+class Snapshot(object):
+    # the changing part of a level: which ships and waypoints are left,
+    # ship body state, fuel and heading, all in flat arrays
+    BODY = ['x', 'y', 'dx', 'dy', 'fx', 'fy', 'px', 'py']
+    HEADER = struct.Struct('<IId')
+    def __init__(self, n_ships, n_waypoints):
+        self.ships = np.zeros(n_ships, dtype=bool)
+        self.waypoints = np.zeros(n_waypoints, dtype=bool)
+        self.bodies = np.zeros((n_ships, len(self.BODY)))
+        self.fuel = np.zeros(n_ships, dtype=np.int64)
+        self.rotation = np.zeros(n_ships, dtype=np.int16)
+        self.thrusting = np.zeros(n_ships, dtype=bool)
+        self.substep = 0.0
+    def arrays(self):
+        return [self.ships, self.waypoints, self.bodies,
+            self.fuel, self.rotation, self.thrusting]
+    def dumps(self):
+        header = self.HEADER.pack(len(self.ships), len(self.waypoints), self.substep)
+        return header + b''.join(array.tobytes() for array in self.arrays())
+    @classmethod
+    def loads(cls, data):
+        n_ships, n_waypoints, substep = cls.HEADER.unpack_from(data)
+        snapshot = cls(n_ships, n_waypoints)
+        snapshot.substep = substep
+        offset = cls.HEADER.size
+        for array in snapshot.arrays():
+            size = array.nbytes
+            array[...] = np.frombuffer(data, array.dtype, array.size, offset).reshape(array.shape)
+            offset += size
+        return snapshot
+        
+def random_layout(width, height, padding, n_ships, n_planets, n_waypoints, rng=random, attempts=30):
+    # positions and radii only, lists of (x, y, r) for ships, planets and
+    # waypoints, raises poisson.LayoutError when they don't fit
+    sampler = poisson.Sampler(width, height, padding, rng, attempts)
     # Ships
+    # the first ship starts in the middle, any others wherever there's room,
+    # each with the same clear space around it
     ships = []
-    for i in range(n_ships): # TODO: handle multiple?
-        x = width / 2
-        y = height / 2
-        ship = Ship(x, y)
-        ships.append(ship)
-        xyr = (x, y, 100)
-        xyrs.append(xyr)
+    for i in range(n_ships):
+        if i == 0:
+            x = width / 2
+            y = height / 2
+            sampler.add((x, y, 100))
+        else:
+            x, y, r = sampler.place(100)
+        ships.append((x, y, Ship.RADIUS))
     # Planets
-    planets = []
-    for i in range(n_planets):
-        while True:
-            r = random.randint(30, 60)
-            p = r + padding
-            x = random.randint(p, width - p)
-            y = random.randint(p, height - p)
-            xyr = (x, y, r)
-            if util.min_xyr_spacing(xyr, xyrs) < padding:
-                continue
-            planet = Planet(x, y, r)
-            planets.append(planet)
-            xyrs.append(xyr)
-            break
+    planets = [sampler.place(rng.randint(30, 60)) for i in range(n_planets)]
     # Waypoints
-    waypoints = []
-    for i in range(n_waypoints):
-        while True:
-            r = 20
-            p = r + padding
-            x = random.randint(p, width - p)
-            y = random.randint(p, height - p)
-            xyr = (x, y, r)
-            if util.min_xyr_spacing(xyr, xyrs) < padding:
-                continue
-            waypoint = Waypoint(x, y, r)
-            waypoints.append(waypoint)
-            xyrs.append(xyr)
-            break
+    waypoints = [sampler.place(20) for i in range(n_waypoints)]
+    return ships, planets, waypoints
+    
+def random_level(width, height, padding, n_ships, n_planets, n_waypoints, seed=None):
+    # the same seed always gives the same level
+    if seed is None:
+        seed = random.randint(0, 0xffffffff)
+    rng = random.Random(seed)
+    ships, planets, waypoints = random_layout(
+        width, height, padding, n_ships, n_planets, n_waypoints, rng)
     # Level
     level = Level()
-    level.ships = ships
-    level.planets = planets
-    level.waypoints = waypoints
+    level.seed = seed
+    level.ships = [Ship(x, y) for x, y, r in ships]
+    level.planets = [Planet(x, y, r, rng) for x, y, r in planets]
+    level.waypoints = [Waypoint(x, y, r) for x, y, r in waypoints]
+    level.finish()
+    return level
+    
+def record_level(record):
+    # a level straight from a levelpack record, planets keep the image and
+    # rotation they were saved with
+    level = Level()
+    level.seed = record.seed
+    level.ships = [Ship(x, y) for x, y in record.ships.tolist()]
+    level.planets = [Planet(x, y, r, image=PLANETS[image], rotation=rotation)
+        for x, y, r, image, rotation in record.planets.tolist()]
+    level.waypoints = [Waypoint(x, y, r) for x, y, r in record.waypoints.tolist()]
+    level.finish()
     return level
     
 def level1():
@@ -357,5 +388,6 @@ def level1():
     level.ships = ships
     level.planets = planets
     level.waypoints = waypoints
+    level.finish()
     return level
     
@@ -1,35 +1,81 @@
-from PIL import Image
-from PIL import ImageDraw
-import math
+import ctypes
+import numpy as np
 import physics
 import pyglet
-import util
+import threading
 
-def gravity_map(bodies, box, step):
+# textures kept for recent planet layouts
+CACHE_SIZE = 8
+
+cache = {}
+
+# values being worked out on background threads
+pending = {}
+
+def gravity_values(bodies, box, step):
+    # log scaled field strength for every pixel in the box, as bytes
     left, top, right, bottom = box
     width, height = right - left, bottom - top
-    image = Image.new('L', (width, height))
-    draw = ImageDraw.Draw(image)
-    for y in range(top, bottom + 1, step):
-        for x in range(left, right + 1, step):
-            tx = 0
-            ty = 0
-            cx = x + step / 2
-            cy = y + step / 2
-            body = physics.Body(cx, cy, 0, True)
-            for other in bodies:
-                dist2 = (body.x - other.x) ** 2 + (body.y - other.y) ** 2
-                if dist2 == 0:
-                    continue # TODO: max out
-                magnitude = physics.G * other.mass / dist2
-                dx, dy = util.unit_vector(body, other)
-                dx, dy = dx * magnitude, dy * magnitude
-                tx, ty = tx + dx, ty + dy
-            length = (tx * tx + ty * ty) ** 0.5
-            value = int(math.log10(length / physics.G) * 128)
-            value = min(255, value)
-            value = max(0, value)
-            draw.rectangle((x, y, x + step, y + step), fill=value)
-    image = image.transpose(Image.FLIP_TOP_BOTTOM)
-    return pyglet.image.ImageData(width, height, 'L', image.tostring(), width * -1)
+    xs = left + np.arange(0, width, step) + step / 2.0
+    ys = top + np.arange(0, height, step) + step / 2.0
+    gx, gy = np.meshgrid(xs, ys)
+    x = np.array([body.x for body in bodies], dtype=float)
+    y = np.array([body.y for body in bodies], dtype=float)
+    mass = np.array([body.mass for body in bodies], dtype=float)
+    ax, ay = physics.accelerations(x, y, mass, gx.ravel(), gy.ravel())
+    with np.errstate(divide='ignore'):
+        values = np.log10(np.hypot(ax, ay) / physics.G) * 128
+    values = np.clip(values, 0, 255).astype(np.uint8)
+    values = values.reshape(len(ys), len(xs))
+    if step > 1:
+        values = np.repeat(np.repeat(values, step, axis=0), step, axis=1)
+    return np.ascontiguousarray(values[:height, :width])
+    
+def prepare(bodies, box, step=1):
+    # starts working the values out on a background thread, numpy does the
+    # work without holding the gil
+    key = (physics.field_key(bodies), box, step)
+    if key in cache or key in pending:
+        return
+    # only the newest layout is wanted, threads still busy with older ones
+    # finish on their own and their values are dropped with them
+    pending.clear()
+    result = {}
+    def run():
+        try:
+            result['values'] = gravity_values(bodies, box, step)
+        except Exception as error:
+            result['error'] = error
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    pending[key] = (thread, result)
+    
+def gravity_map(bodies, box, step=1, wait=True):
+    # without wait, None until the values from prepare are ready
+    key = (physics.field_key(bodies), box, step)
+    if key not in cache:
+        if key not in pending:
+            if not wait:
+                prepare(bodies, box, step)
+                return None
+            values = gravity_values(bodies, box, step)
+        else:
+            thread, result = pending[key]
+            if not wait and thread.is_alive():
+                return None
+            thread.join()
+            del pending[key]
+            if 'error' in result:
+                # raised again here, where the caller can see it
+                raise result['error']
+            values = result['values']
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        height, width = values.shape
+        # rows run bottom up like the texture, upload straight from the array
+        data = (ctypes.c_ubyte * values.size).from_buffer(values)
+        image = pyglet.image.ImageData(width, height, 'L', data, width)
+        cache[key] = image.get_texture()
+    return cache[key]
     
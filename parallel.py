@@ -0,0 +1,41 @@
+import multiprocessing
+import multiprocessing.pool
+import numpy as np
+import physics
+
+class Solver(object):
+    # splits the target points into one block per worker and works out the
+    # blocks on a thread pool, numpy releases the gil inside its kernels so
+    # the blocks run on separate cores. wraps physics.accelerations or any
+    # solver with the same signature, solvers with a prepare method (the
+    # barnes-hut tree) are prepared once and shared by the blocks
+    def __init__(self, workers=None, solver=None, minimum=256):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.solver = solver or physics.accelerations
+        self.minimum = minimum
+        self.pool = None
+    def __call__(self, x, y, mass, tx, ty):
+        blocks = min(self.workers, len(tx) // self.minimum)
+        if blocks < 2:
+            return self.solver(x, y, mass, tx, ty)
+        if hasattr(self.solver, 'prepare'):
+            function = self.solver.prepare(x, y, mass)
+        else:
+            def function(tx, ty):
+                return self.solver(x, y, mass, tx, ty)
+        bounds = np.linspace(0, len(tx), blocks + 1).astype(int)
+        def block(i):
+            a, b = bounds[i], bounds[i + 1]
+            return function(tx[a:b], ty[a:b])
+        if self.pool is None:
+            self.pool = multiprocessing.pool.ThreadPool(self.workers)
+        results = self.pool.map(block, range(blocks))
+        ax = np.concatenate([result[0] for result in results])
+        ay = np.concatenate([result[1] for result in results])
+        return ax, ay
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            
\ No newline at end of file
@@ -0,0 +1,134 @@
+from pyglet.gl import *
+import assets
+import ctypes
+import numpy as np
+
+class Kind(object):
+    # how one type of particle looks and moves, several image paths make
+    # an animation played once over the particle's lifetime
+    def __init__(self, paths, speed, spin, scale=0.0, growth=0.0, lifetime=1.0):
+        self.paths = paths
+        self.speed = speed
+        self.spin = spin
+        self.scale = scale
+        self.growth = growth
+        self.lifetime = lifetime
+        
+KINDS = {
+    'waypoint': Kind(['images/star_blue.png'], (20, 100), (-360, 360), growth=1 / 16.0),
+    'planet': Kind(['images/smoke.png'], (0, 50), (-180, 180), growth=1 / 4.0),
+    'explosion': Kind(['images/explosion/%d.png' % i for i in range(1, 9)],
+        (0, 0), (0, 0), scale=1.5, lifetime=0.5),
+}
+
+# per particle state, all arrays are kept the same length
+FIELDS = ['x', 'y', 'cos', 'sin', 'speed', 'rotation', 'spin', 'age', 'kind']
+
+class ParticleSystem(object):
+    def __init__(self, batch, group):
+        self.batch = batch
+        self.group = group
+        self.names = sorted(KINDS)
+        self.kinds = [KINDS[name] for name in self.names]
+        for field in FIELDS:
+            setattr(self, field, np.zeros(0, dtype=int if field == 'kind' else float))
+        self.frames = None
+        self.vertex_lists = {}
+    @property
+    def count(self):
+        return len(self.x)
+    def load(self):
+        # flatten the frames of every kind into lookup tables
+        frames = []
+        self.first_frame = []
+        self.frame_count = []
+        for kind in self.kinds:
+            self.first_frame.append(len(frames))
+            self.frame_count.append(len(kind.paths))
+            frames.extend(assets.load_image(path) for path in kind.paths)
+        self.frames = frames
+        self.first_frame = np.array(self.first_frame)
+        self.frame_count = np.array(self.frame_count)
+        self.tex_coords = np.array([f.tex_coords for f in frames], dtype=np.float32)
+        self.bounds = np.array([
+            (-f.anchor_x, -f.anchor_y, f.width - f.anchor_x, f.height - f.anchor_y)
+            for f in frames], dtype=float)
+        self.textures = np.array([f.id for f in frames])
+        self.scale = np.array([kind.scale for kind in self.kinds])
+        self.growth = np.array([kind.growth for kind in self.kinds])
+        self.lifetime = np.array([kind.lifetime for kind in self.kinds])
+    def emit(self, name, x, y, count=10):
+        if self.frames is None:
+            self.load()
+        kind = KINDS[name]
+        angle = np.radians(np.random.randint(0, 360, count))
+        values = {
+            'x': np.repeat(float(x), count),
+            'y': np.repeat(float(y), count),
+            'cos': np.cos(angle),
+            'sin': np.sin(angle),
+            'speed': np.random.randint(kind.speed[0], kind.speed[1] + 1, count),
+            'rotation': np.random.randint(0, 360, count),
+            'spin': np.random.randint(kind.spin[0], kind.spin[1] + 1, count),
+            'age': np.zeros(count),
+            'kind': np.repeat(self.names.index(name), count),
+        }
+        for field in FIELDS:
+            setattr(self, field, np.concatenate((getattr(self, field), values[field])))
+        self.update(0)
+    def update(self, dt):
+        if not self.count and not self.vertex_lists:
+            return
+        self.age += dt
+        alive = self.age < self.lifetime[self.kind]
+        if not alive.all():
+            for field in FIELDS:
+                setattr(self, field, getattr(self, field)[alive])
+        self.update_vertices()
+    def update_vertices(self):
+        kind = self.kind
+        t = self.age
+        progress = t / self.lifetime[kind]
+        frame = np.minimum(
+            (progress * self.frame_count[kind]).astype(int), self.frame_count[kind] - 1)
+        frame += self.first_frame[kind]
+        scale = self.scale[kind] + self.growth[kind] * t
+        angle = -np.radians(self.rotation + t * self.spin)
+        cr, sr = np.cos(angle), np.sin(angle)
+        d = t * self.speed
+        x = self.x + self.cos * d
+        y = self.y + self.sin * d
+        left, bottom, right, top = (self.bounds[frame] * scale[:, None]).T
+        corners = [(left, bottom), (right, bottom), (right, top), (left, top)]
+        vertices = np.empty((self.count, 4, 2), dtype=np.float32)
+        for i, (u, v) in enumerate(corners):
+            vertices[:, i, 0] = x + u * cr - v * sr
+            vertices[:, i, 1] = y + u * sr + v * cr
+        colors = np.full((self.count, 4, 4), 255, dtype=np.uint8)
+        colors[:, :, 3] = np.clip(255 - 255 * progress, 0, 255)[:, None]
+        tex_coords = self.tex_coords[frame]
+        textures = self.textures[frame]
+        for texture in set(self.vertex_lists) | set(textures):
+            mask = textures == texture
+            self.upload(texture, vertices[mask], tex_coords[mask], colors[mask])
+    def upload(self, texture, vertices, tex_coords, colors):
+        # one vertex list per texture, normally the single sprite atlas
+        count = len(vertices) * 4
+        vertex_list = self.vertex_lists.get(texture)
+        if not count:
+            if vertex_list is not None:
+                vertex_list.delete()
+                del self.vertex_lists[texture]
+            return
+        if vertex_list is None:
+            image = self.frames[list(self.textures).index(texture)]
+            group = pyglet.graphics.TextureGroup(image, parent=self.group)
+            vertex_list = self.batch.add(count, GL_QUADS, group,
+                'v2f/stream', 't3f/stream', 'c4B/stream')
+            self.vertex_lists[texture] = vertex_list
+        elif vertex_list.get_size() != count:
+            vertex_list.resize(count)
+        for array, data in ((vertex_list.vertices, vertices),
+                (vertex_list.tex_coords, tex_coords), (vertex_list.colors, colors)):
+            data = np.ascontiguousarray(data)
+            ctypes.memmove(array, data.ctypes.data, data.nbytes)
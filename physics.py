@@ -1,15 +1,137 @@
-import util
+import numpy as np
 
 G = 8e-6
 
+# max pairwise terms evaluated at once
+CHUNK = 1 << 20
+
+# fixed by mobile pairs from which sampling the field beats summing the
+# fixed bodies directly, below it numpy call overhead dominates
+FIELD_PAIRS = 20000
+
+def array_property(name):
+    def fget(self):
+        return getattr(self.system, name)[self.index]
+    def fset(self, value):
+        getattr(self.system, name)[self.index] = value
+    return property(fget, fset)
+    
+ARRAYS = ['x', 'y', 'dx', 'dy', 'r', 'fixed', 'fx', 'fy', 'px', 'py']
+
+class System(object):
+    def __init__(self, size=0):
+        self.bodies = None
+        # the arrays are views onto buffers with room to grow, so adding
+        # and removing bodies doesn't copy every array each time
+        self.buffers = {}
+        for name in ARRAYS:
+            self.buffers[name] = np.zeros(size, dtype=bool if name == 'fixed' else float)
+        self.resize(size)
+        # step length guess for the adaptive integrator
+        self.substep = None
+    def resize(self, size):
+        capacity = len(self.buffers['x'])
+        if size > capacity:
+            capacity = max(size, 2 * capacity, 16)
+            for name, buffer in self.buffers.items():
+                grown = np.zeros(capacity, dtype=buffer.dtype)
+                grown[:len(buffer)] = buffer
+                self.buffers[name] = grown
+        self.size = size
+        # x, y, dx, dy, r, fixed, constant per-step forces (thrust) fx, fy
+        # and positions before the last step px, py
+        for name in ARRAYS:
+            setattr(self, name, self.buffers[name][:size])
+    def add(self, body):
+        # the body moves in at the end of the arrays
+        index = self.size
+        self.resize(index + 1)
+        for name in ARRAYS:
+            getattr(self, name)[index] = getattr(body, name)
+        body.system = self
+        body.index = index
+        self.bodies.append(body)
+    def remove(self, body):
+        # the last body takes the place of the removed one, which gets a
+        # system of its own so its state can still be read
+        index = body.index
+        last = self.size - 1
+        system = System(1)
+        for name in ARRAYS:
+            array = getattr(self, name)
+            getattr(system, name)[0] = array[index]
+            array[index] = array[last]
+        moved = self.bodies.pop()
+        if moved is not body:
+            self.bodies[index] = moved
+            moved.index = index
+        self.resize(last)
+        system.bodies = [body]
+        body.system = system
+        body.index = 0
+    @property
+    def mass(self):
+        return self.r ** 3
+    @property
+    def mobile(self):
+        return np.flatnonzero(~self.fixed)
+    def accelerations(self, mobile, field=None, solver=None):
+        solver = solver or accelerations
+        x, y = self.x[mobile], self.y[mobile]
+        if field is None:
+            ax, ay = solver(self.x, self.y, self.mass, x, y)
+        else:
+            # the field stands in for the pull of the fixed bodies
+            ax, ay = solver(x, y, self.mass[mobile], x, y)
+            fx, fy = field.sample(x, y)
+            ax += fx
+            ay += fy
+        return ax + self.fx[mobile], ay + self.fy[mobile]
+    def update(self, field=None, solver=None, steps=1, dt=1, integrator='euler'):
+        mobile = self.mobile
+        if not len(mobile) or not steps:
+            return
+        INTEGRATORS[integrator](self, mobile, field, solver, steps, dt)
+    def energy(self, field=None):
+        # kinetic plus potential energy of the mobile bodies, the constant
+        # energy between pairs of fixed bodies is left out
+        mobile = self.mobile
+        mass = self.mass
+        m = mass[mobile]
+        x, y = self.x[mobile], self.y[mobile]
+        if field is None:
+            phi = potentials(self.x, self.y, mass, x, y)
+        else:
+            phi = field.potentials(x, y)
+            phi += potentials(x, y, m, x, y)
+        # pairs of mobile bodies were counted from both sides
+        phi -= potentials(x, y, m, x, y) / 2
+        v2 = self.dx[mobile] ** 2 + self.dy[mobile] ** 2
+        return (m * v2 / 2).sum() + (m * phi).sum()
+    def copy(self):
+        system = System(self.size)
+        for name in ARRAYS:
+            getattr(system, name)[:] = getattr(self, name)
+        return system
+        
 class Body(object):
+    x = array_property('x')
+    y = array_property('y')
+    dx = array_property('dx')
+    dy = array_property('dy')
+    r = array_property('r')
+    fixed = array_property('fixed')
+    fx = array_property('fx')
+    fy = array_property('fy')
+    px = array_property('px')
+    py = array_property('py')
     def __init__(self, x, y, r, fixed=True):
-        self.x = x
-        self.y = y
+        self.system = System(1)
+        self.index = 0
+        self.x = self.px = x
+        self.y = self.py = y
         self.r = r
         self.fixed = fixed
-        self.dx = 0
-        self.dy = 0
     @property
     def xyr(self):
         return (self.x, self.y, self.r)
@@ -22,26 +144,219 @@ class Body(object):
     def force(self, dx, dy):
         self.dx += dx
         self.dy += dy
+    def lerp(self, alpha):
+        # position between the last two steps, for rendering
+        x = self.px + (self.x - self.px) * alpha
+        y = self.py + (self.y - self.py) * alpha
+        return x, y
+        
+def bind(bodies):
+    # move the bodies into one contiguous system, bodies become views onto it
+    system = System(len(bodies))
+    for index, body in enumerate(bodies):
+        for name in ARRAYS:
+            getattr(system, name)[index] = getattr(body, name)
+        body.system = system
+        body.index = index
+    system.bodies = bodies
+    return system
+    
+class Field(object):
+    # gravity of the fixed bodies sampled on a grid, bilinear interpolation
+    # is used away from the bodies and exact summation close to them
+    def __init__(self, bodies, step=4, padding=320):
+        self.key = field_key(bodies)
+        self.x = np.array([body.x for body in bodies], dtype=float)
+        self.y = np.array([body.y for body in bodies], dtype=float)
+        self.r = np.array([body.r for body in bodies], dtype=float)
+        self.mass = self.r ** 3
+        self.step = step
+        if not bodies:
+            self.left = self.top = 0
+            self.ax = self.ay = np.zeros((0, 0))
+            self.near = np.zeros((0, 0), dtype=bool)
+            return
+        self.left = (self.x - self.r).min() - padding
+        self.top = (self.y - self.r).min() - padding
+        right = (self.x + self.r).max() + padding
+        bottom = (self.y + self.r).max() + padding
+        nx = int(np.ceil((right - self.left) / step)) + 1
+        ny = int(np.ceil((bottom - self.top) / step)) + 1
+        gx, gy = np.meshgrid(
+            self.left + np.arange(nx) * step, self.top + np.arange(ny) * step)
+        ax, ay = accelerations(
+            self.x, self.y, self.mass, gx.ravel(), gy.ravel())
+        self.ax = ax.reshape(ny, nx)
+        self.ay = ay.reshape(ny, nx)
+        near = np.zeros((ny, nx), dtype=bool)
+        for x, y, r in zip(self.x, self.y, self.r):
+            near |= (gx - x) ** 2 + (gy - y) ** 2 < (2 * r + 2 * step) ** 2
+        self.near = near
+    def sample(self, x, y):
+        ny, nx = self.ax.shape
+        u = (x - self.left) / self.step
+        v = (y - self.top) / self.step
+        i = np.floor(u).astype(int)
+        j = np.floor(v).astype(int)
+        exact = (i < 0) | (j < 0) | (i >= nx - 1) | (j >= ny - 1)
+        grid = ~exact
+        exact[grid] = self.near[j[grid], i[grid]]
+        grid = ~exact
+        ax = np.zeros(len(x))
+        ay = np.zeros(len(x))
+        if grid.any():
+            i, j = i[grid], j[grid]
+            fu, fv = u[grid] - i, v[grid] - j
+            w00 = (1 - fu) * (1 - fv)
+            w10 = fu * (1 - fv)
+            w01 = (1 - fu) * fv
+            w11 = fu * fv
+            for a, values in ((ax, self.ax), (ay, self.ay)):
+                a[grid] = (
+                    values[j, i] * w00 + values[j, i + 1] * w10 +
+                    values[j + 1, i] * w01 + values[j + 1, i + 1] * w11)
+        if exact.any():
+            ax[exact], ay[exact] = accelerations(
+                self.x, self.y, self.mass, x[exact], y[exact])
+        return ax, ay
+    def potentials(self, x, y):
+        return potentials(self.x, self.y, self.mass, x, y)
+        
+def euler(system, mobile, field, solver, steps, dt):
+    # semi-implicit euler, first order
+    for step in range(steps):
+        if step == steps - 1:
+            system.px[:] = system.x
+            system.py[:] = system.y
+        ax, ay = system.accelerations(mobile, field, solver)
+        system.dx[mobile] += ax * dt
+        system.dy[mobile] += ay * dt
+        system.x[mobile] += system.dx[mobile] * dt
+        system.y[mobile] += system.dy[mobile] * dt
         
-def update(bodies):
-    results = {}
-    for body in bodies:
-        if body.fixed:
-            continue
-        tx, ty = 0, 0
-        for other in bodies:
-            if other == body:
-                continue
-            dist2 = (body.x - other.x) ** 2 + (body.y - other.y) ** 2
-            magnitude = G * other.mass / dist2
-            dx, dy = util.unit_vector(body, other)
-            dx, dy = dx * magnitude, dy * magnitude
-            tx, ty = tx + dx, ty + dy
-        # TODO: sound based on G forces
-        #tt = abs(tx) + abs(ty)
-        #print int(tt / G)
-        results[body] = (tx, ty)
-    for body, (dx, dy) in results.iteritems():
-        body.force(dx, dy)
-        body.move()
-        
\ No newline at end of file
+def verlet(system, mobile, field, solver, steps, dt):
+    # velocity verlet (kick-drift-kick leapfrog), second order
+    ax, ay = system.accelerations(mobile, field, solver)
+    for step in range(steps):
+        if step == steps - 1:
+            system.px[:] = system.x
+            system.py[:] = system.y
+        system.dx[mobile] += ax * (dt / 2.0)
+        system.dy[mobile] += ay * (dt / 2.0)
+        system.x[mobile] += system.dx[mobile] * dt
+        system.y[mobile] += system.dy[mobile] * dt
+        ax, ay = system.accelerations(mobile, field, solver)
+        system.dx[mobile] += ax * (dt / 2.0)
+        system.dy[mobile] += ay * (dt / 2.0)
+        
+# dormand-prince 5(4) tableau
+RK45_A = [
+    [],
+    [1 / 5.0],
+    [3 / 40.0, 9 / 40.0],
+    [44 / 45.0, -56 / 15.0, 32 / 9.0],
+    [19372 / 6561.0, -25360 / 2187.0, 64448 / 6561.0, -212 / 729.0],
+    [9017 / 3168.0, -355 / 33.0, 46732 / 5247.0, 49 / 176.0,
+        -5103 / 18656.0],
+    [35 / 384.0, 0, 500 / 1113.0, 125 / 192.0, -2187 / 6784.0, 11 / 84.0],
+]
+RK45_E = [
+    35 / 384.0 - 5179 / 57600.0, 0, 500 / 1113.0 - 7571 / 16695.0,
+    125 / 192.0 - 393 / 640.0, -2187 / 6784.0 + 92097 / 339200.0,
+    11 / 84.0 - 187 / 2100.0, -1 / 40.0,
+]
+
+def rk45(system, mobile, field, solver, steps, dt, tolerance=1e-4):
+    # adaptive dormand-prince, each step of length dt is covered by as many
+    # substeps as needed to keep the position error below the tolerance
+    def derivative(state):
+        system.x[mobile], system.y[mobile] = state[0], state[1]
+        ax, ay = system.accelerations(mobile, field, solver)
+        return np.array([state[2], state[3], ax, ay])
+    state = np.array([
+        system.x[mobile], system.y[mobile],
+        system.dx[mobile], system.dy[mobile]])
+    h = system.substep or dt
+    for step in range(steps):
+        if step == steps - 1:
+            system.px[:] = system.x
+            system.py[:] = system.y
+            system.px[mobile], system.py[mobile] = state[0], state[1]
+        t = 0.0
+        while t < dt:
+            h = min(h, dt - t)
+            k = []
+            for a in RK45_A:
+                stage = state + sum(c * h * ki for c, ki in zip(a, k) if c)
+                k.append(derivative(stage))
+            error = sum(c * h * ki for c, ki in zip(RK45_E, k) if c)
+            error = np.abs(error[:2]).max() / tolerance
+            if error <= 1:
+                # fsal, the last stage is the fifth order solution
+                state = state + sum(
+                    c * h * ki for c, ki in zip(RK45_A[-1], k) if c)
+                t += h
+            h *= min(5.0, max(0.2, 0.9 * (error or 1e-10) ** -0.2))
+        system.substep = h
+    system.x[mobile], system.y[mobile] = state[0], state[1]
+    system.dx[mobile], system.dy[mobile] = state[2], state[3]
+    
+INTEGRATORS = {
+    'euler': euler,
+    'verlet': verlet,
+    'rk45': rk45,
+}
+
+def field_key(bodies):
+    return tuple(body.xyr for body in bodies)
+    
+def accelerations(x, y, mass, tx, ty):
+    # acceleration at each target point due to every source mass,
+    # coincident pairs (a body and itself) contribute nothing
+    ax = np.zeros(len(tx))
+    ay = np.zeros(len(tx))
+    chunk = max(1, CHUNK // max(1, len(x)))
+    for i in range(0, len(tx), chunk):
+        j = i + chunk
+        dx = x - tx[i:j, None]
+        dy = y - ty[i:j, None]
+        d2 = dx * dx + dy * dy
+        d2[d2 == 0] = np.inf
+        f = G * mass / (d2 * np.sqrt(d2))
+        ax[i:j] = (f * dx).sum(axis=1)
+        ay[i:j] = (f * dy).sum(axis=1)
+    return ax, ay
+    
+def potentials(x, y, mass, tx, ty):
+    # gravitational potential at each target point, see accelerations
+    phi = np.zeros(len(tx))
+    chunk = max(1, CHUNK // max(1, len(x)))
+    for i in range(0, len(tx), chunk):
+        j = i + chunk
+        d2 = (x - tx[i:j, None]) ** 2 + (y - ty[i:j, None]) ** 2
+        d2[d2 == 0] = np.inf
+        phi[i:j] = -(G * mass / np.sqrt(d2)).sum(axis=1)
+    return phi
+    
+def system_of(bodies):
+    system = bodies[0].system
+    if system.bodies is not bodies or system.size != len(bodies):
+        system = bind(bodies)
+    return system
+    
+def update(bodies, field=None, solver=None, steps=1, dt=1, integrator='euler'):
+    if not bodies:
+        return
+    # TODO: sound based on G forces
+    system_of(bodies).update(field, solver, steps, dt, integrator)
+    
+def energy(bodies, field=None):
+    return system_of(bodies).energy(field) if bodies else 0.0
+    
+def drift(bodies, steps, dt=1, integrator='euler', field=None, solver=None):
+    # relative energy change over a run, on a copy of the bodies
+    system = system_of(bodies).copy()
+    before = system.energy(field)
+    system.update(field, solver, steps, dt, integrator)
+    after = system.energy(field)
+    return (after - before) / abs(before) if before else 0.0
@@ -0,0 +1,51 @@
+import math
+import random
+import spatial
+import util
+
+class LayoutError(Exception):
+    pass
+
+class Sampler(object):
+    # poisson-disk placement of circles inside a rectangle, every circle is
+    # at least spacing away from the others, placed circles live in a
+    # spatial hash so each try only looks at its neighbours
+    def __init__(self, width, height, spacing, rng=random, attempts=30):
+        self.width = width
+        self.height = height
+        self.spacing = spacing
+        self.rng = rng
+        self.attempts = attempts
+        self.hash = spatial.SpatialHash(128)
+        self.xyrs = []
+    def fits(self, xyr):
+        x, y, r = xyr
+        p = r + self.spacing
+        if x < p or y < p or x > self.width - p or y > self.height - p:
+            return False
+        nearby = self.hash.query((x, y, p))
+        return not nearby or util.min_xyr_spacing(xyr, nearby) >= self.spacing
+    def add(self, xyr):
+        self.xyrs.append(xyr)
+        self.hash.add(xyr, xyr)
+    def place(self, r):
+        # uniform tries first, then tries in the ring just outside a random
+        # placed circle, which finds the gaps left in dense layouts
+        rng = self.rng
+        p = r + self.spacing
+        if 2 * p <= self.width and 2 * p <= self.height:
+            for i in range(self.attempts):
+                xyr = (rng.randint(p, self.width - p), rng.randint(p, self.height - p), r)
+                if self.fits(xyr):
+                    self.add(xyr)
+                    return xyr
+            for i in range(self.attempts if self.xyrs else 0):
+                x, y, other = rng.choice(self.xyrs)
+                d = other + p + 1 + rng.uniform(0, self.spacing)
+                angle = rng.uniform(0, 2 * math.pi)
+                xyr = (int(round(x + d * math.cos(angle))),
+                    int(round(y + d * math.sin(angle))), r)
+                if self.fits(xyr):
+                    self.add(xyr)
+                    return xyr
+        raise LayoutError('no room for radius %d after %d circles' % (r, len(self.xyrs)))
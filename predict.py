@@ -0,0 +1,112 @@
+import math
+import numpy as np
+import physics
+import threading
+import time
+
+class Predictor(object):
+    # flight path of one ship under constant thrust, pulled by the planets
+    # of the level, other ships are left out. the state at every tick is
+    # kept so the next prediction can start from the matching tick of the
+    # previous one and only compute the ticks past its end
+    def __init__(self, planets, dt=1, ticks=3000, stride=10, radius=12,
+            budget=500, chunk=100):
+        self.planets = [(x, y, r ** 3, (r + radius) ** 2) for x, y, r in
+            (planet.xyr for planet in planets)]
+        self.dt = dt
+        self.ticks = ticks
+        self.stride = stride
+        # ticks worked out per prediction, a long path is finished over the
+        # next few posts, and how many run between giving up the gil
+        self.budget = budget
+        self.chunk = chunk
+        self.states = np.zeros((0, 4))
+        self.thrust = None
+        self.crashed = False
+        self.points = np.zeros((0, 2), dtype=np.float32)
+        self.pending = None
+        self.running = False
+        self.condition = threading.Condition()
+    def predict(self, state, thrust):
+        self.reuse(np.array(state, dtype=float), tuple(thrust))
+        self.extend()
+        points = self.states[::self.stride, :2]
+        if (len(self.states) - 1) % self.stride:
+            points = np.concatenate((points, self.states[-1:, :2]))
+        self.points = points.astype(np.float32)
+        return self.points
+    def reuse(self, state, thrust):
+        if thrust == self.thrust and len(self.states):
+            error = np.abs(self.states - state).max(axis=1)
+            match = np.flatnonzero(error < 1e-9)
+            if len(match):
+                self.states = self.states[match[0]:]
+                return
+        self.thrust = thrust
+        self.states = state[None]
+        self.crashed = False
+    def extend(self):
+        # same steps as physics.euler summing the planets directly, in plain
+        # floats since numpy calls on a single point cost more than the
+        # sums. the path stops where it hits a planet
+        count = min(self.ticks + 1 - len(self.states), self.budget)
+        if self.crashed or count <= 0:
+            return
+        planets = self.planets
+        dt = self.dt
+        g = physics.G
+        sqrt = math.sqrt
+        fx, fy = self.thrust
+        x, y, dx, dy = self.states[-1].tolist()
+        states = []
+        for i in range(count):
+            ax = ay = 0.0
+            crashed = False
+            for px, py, mass, limit in planets:
+                ux = px - x
+                uy = py - y
+                d2 = ux * ux + uy * uy
+                f = g * mass / (d2 * sqrt(d2))
+                ax += f * ux
+                ay += f * uy
+            dx += (ax + fx) * dt
+            dy += (ay + fy) * dt
+            x += dx * dt
+            y += dy * dt
+            states.append((x, y, dx, dy))
+            for px, py, mass, limit in planets:
+                if (px - x) ** 2 + (py - y) ** 2 < limit:
+                    crashed = True
+            if crashed:
+                self.crashed = True
+                break
+            if i % self.chunk == self.chunk - 1:
+                # let the main thread run
+                time.sleep(0)
+        self.states = np.concatenate((self.states, np.array(states)))
+    def start(self):
+        # predictions run on a background thread, post() hands it the
+        # latest state and points holds the latest result
+        self.running = True
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+    def post(self, state, thrust):
+        # a request still waiting is replaced, only the newest one matters
+        with self.condition:
+            self.pending = (state, thrust)
+            self.condition.notify()
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                state, thrust = self.pending
+                self.pending = None
+            self.predict(state, thrust)
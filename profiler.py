@@ -0,0 +1,94 @@
+import collections
+import csv
+import json
+import timeit
+
+# off by default, timers and counters cost one check while disabled
+enabled = False
+
+# frames kept for the overlay and the exporters
+HISTORY = 1000
+
+history = collections.deque(maxlen=HISTORY)
+current = collections.defaultdict(float)
+
+class Timer(object):
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.start = timeit.default_timer()
+    def __exit__(self, *args):
+        current[self.name] += (timeit.default_timer() - self.start) * 1000
+        
+class Null(object):
+    def __enter__(self):
+        pass
+    def __exit__(self, *args):
+        pass
+        
+null = Null()
+timers = {}
+
+def timer(name):
+    # milliseconds spent in the block, summed over the frame
+    if not enabled:
+        return null
+    if name not in timers:
+        timers[name] = Timer(name)
+    return timers[name]
+    
+def count(name, n=1):
+    # events over the frame, ticks or collision tests
+    if enabled:
+        current[name] += n
+        
+def gauge(name, value):
+    # a level at the end of the frame, sprites or vertex lists alive
+    if enabled:
+        current[name] = value
+        
+def frame():
+    # closes the current frame and starts the next one
+    if enabled:
+        history.append(dict(current))
+        current.clear()
+        
+def reset():
+    history.clear()
+    current.clear()
+    
+def names():
+    return sorted(set(name for record in history for name in record))
+    
+def summary():
+    result = {}
+    for name in names():
+        values = [record.get(name, 0) for record in history]
+        result[name] = {
+            'mean': sum(values) / len(values),
+            'max': max(values),
+            'last': values[-1],
+        }
+    return result
+    
+def text():
+    # one line per timer or counter, for the on-screen overlay
+    lines = []
+    for name, values in sorted(summary().items()):
+        lines.append('%-12s %8.2f %8.2f' % (name, values['last'], values['mean']))
+    return '\n'.join(lines)
+    
+def export(path):
+    # csv with one row per frame, or json with the frames and a summary
+    frames = list(history)
+    if path.endswith('.csv'):
+        columns = names()
+        with open(path, 'w') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['frame'] + columns)
+            for index, record in enumerate(frames):
+                writer.writerow([index] + [record.get(name, 0) for name in columns])
+    else:
+        with open(path, 'w') as fp:
+            json.dump({'frames': frames, 'summary': summary()}, fp, indent=2)
+            
\ No newline at end of file
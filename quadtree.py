@@ -0,0 +1,130 @@
+import numpy as np
+import physics
+
+DEPTH = 16
+
+def interleave(ix, iy):
+    # morton code, bits of x on even positions and bits of y on odd ones
+    code = np.zeros(len(ix), dtype=np.int64)
+    for bit in range(DEPTH):
+        code |= ((ix >> bit) & 1) << (2 * bit)
+        code |= ((iy >> bit) & 1) << (2 * bit + 1)
+    return code
+    
+def ranges(starts, counts):
+    # concatenation of arange(start, start + count) for each pair
+    offsets = np.cumsum(counts) - counts
+    index = np.arange(counts.sum()) - np.repeat(offsets, counts)
+    return index + np.repeat(starts, counts)
+    
+class Level(object):
+    def __init__(self, keys, starts, ends, x, y, mass):
+        self.keys = keys[starts]
+        self.starts = starts
+        self.ends = ends
+        self.count = ends - starts
+        self.mass = np.add.reduceat(mass, starts)
+        total = np.where(self.mass > 0, self.mass, 1)
+        single = self.count == 1
+        self.x = np.where(
+            single, x[starts], np.add.reduceat(mass * x, starts) / total)
+        self.y = np.where(
+            single, y[starts], np.add.reduceat(mass * y, starts) / total)
+        self.left = np.minimum.reduceat(x, starts)
+        self.right = np.maximum.reduceat(x, starts)
+        self.top = np.minimum.reduceat(y, starts)
+        self.bottom = np.maximum.reduceat(y, starts)
+        
+class QuadTree(object):
+    def __init__(self, x, y, mass):
+        left, top = x.min(), y.min()
+        size = max(x.max() - left, y.max() - top) or 1.0
+        scale = (1 << DEPTH) / (size * (1 + 1e-9))
+        ix = np.clip(((x - left) * scale).astype(np.int64), 0, (1 << DEPTH) - 1)
+        iy = np.clip(((y - top) * scale).astype(np.int64), 0, (1 << DEPTH) - 1)
+        codes = interleave(ix, iy)
+        order = np.argsort(codes, kind='mergesort')
+        codes = codes[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.mass = mass[order]
+        self.size = size
+        self.levels = []
+        for depth in range(DEPTH + 1):
+            keys = codes >> (2 * (DEPTH - depth))
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            ends = np.r_[starts[1:], len(keys)]
+            self.levels.append(
+                Level(keys, starts, ends, self.x, self.y, self.mass))
+        for parent, child in zip(self.levels, self.levels[1:]):
+            parent.first = np.searchsorted(child.keys, parent.keys << 2)
+            parent.last = np.searchsorted(child.keys, (parent.keys + 1) << 2)
+    def accelerations(self, tx, ty, theta):
+        ax = np.zeros(len(tx))
+        ay = np.zeros(len(tx))
+        targets = np.arange(len(tx))
+        nodes = np.zeros(len(tx), dtype=np.int64)
+        for depth, level in enumerate(self.levels):
+            if not len(targets):
+                break
+            size = self.size / (1 << depth)
+            px, py = tx[targets], ty[targets]
+            dx = level.x[nodes] - px
+            dy = level.y[nodes] - py
+            d2 = dx * dx + dy * dy
+            inside = (
+                (px >= level.left[nodes]) & (px <= level.right[nodes]) &
+                (py >= level.top[nodes]) & (py <= level.bottom[nodes]))
+            accept = (level.count[nodes] == 1) | (
+                ~inside & (size * size < theta * theta * d2))
+            self.add(ax, ay, targets[accept], level.mass[nodes[accept]],
+                dx[accept], dy[accept], d2[accept])
+            targets, nodes = targets[~accept], nodes[~accept]
+            if depth == DEPTH:
+                break
+            counts = level.last[nodes] - level.first[nodes]
+            nodes = ranges(level.first[nodes], counts)
+            targets = np.repeat(targets, counts)
+        if len(targets):
+            # bodies sharing a cell at full depth are summed directly
+            level = self.levels[-1]
+            counts = level.count[nodes]
+            bodies = ranges(level.starts[nodes], counts)
+            targets = np.repeat(targets, counts)
+            dx = self.x[bodies] - tx[targets]
+            dy = self.y[bodies] - ty[targets]
+            self.add(ax, ay, targets, self.mass[bodies], dx, dy,
+                dx * dx + dy * dy)
+        return ax, ay
+    def add(self, ax, ay, targets, mass, dx, dy, d2):
+        d2 = np.where(d2 == 0, np.inf, d2)
+        f = physics.G * mass / (d2 * np.sqrt(d2))
+        ax += np.bincount(targets, f * dx, len(ax))
+        ay += np.bincount(targets, f * dy, len(ay))
+        
+class Solver(object):
+    # barnes-hut replacement for physics.accelerations, smaller theta is
+    # more accurate, zero degenerates to direct summation
+    def __init__(self, theta=0.5):
+        self.theta = theta
+    def __call__(self, x, y, mass, tx, ty):
+        return self.prepare(x, y, mass)(tx, ty)
+    def prepare(self, x, y, mass):
+        # builds the tree once, the function returned can be called for
+        # any number of target blocks
+        if not len(x):
+            return lambda tx, ty: (np.zeros(len(tx)), np.zeros(len(tx)))
+        tree = QuadTree(x, y, mass)
+        return lambda tx, ty: tree.accelerations(tx, ty, self.theta)
+    def error(self, x, y, mass, samples=1000):
+        # relative force error against the exact path on a sample of bodies
+        index = np.arange(len(x))
+        if len(index) > samples:
+            index = np.random.choice(index, samples, replace=False)
+        tx, ty = x[index], y[index]
+        ax, ay = self(x, y, mass, tx, ty)
+        ex, ey = physics.accelerations(x, y, mass, tx, ty)
+        exact = np.hypot(ex, ey)
+        exact[exact == 0] = np.inf
+        error = np.hypot(ax - ex, ay - ey) / exact
+        return np.sqrt(np.mean(error ** 2)), error.max()
@@ -0,0 +1,144 @@
+import hashlib
+import model
+import numpy as np
+import physics
+import struct
+import sys
+import timeit
+
+MAGIC = b'GRV2'
+
+# magic, seed, width, height, padding, ships, planets, waypoints, dt, integrator
+HEADER = struct.Struct('<4sIiiiiiiH8s')
+COUNT = struct.Struct('<I')
+
+# steps taken by one window update and the thrust held during it
+FRAME = np.dtype([('steps', '<u2'), ('dx', 'i1'), ('dy', 'i1')])
+
+# frame index, tick and state hash after that frame
+CHECKPOINT = np.dtype([('frame', '<u4'), ('tick', '<u4'), ('hash', 'u1', 20)])
+
+# ticks between checkpoints
+INTERVAL = 1000
+
+def state_hash(level):
+    digest = hashlib.sha1()
+    if level.bodies:
+        system = physics.system_of(level.bodies)
+        for name in ('x', 'y', 'dx', 'dy'):
+            digest.update(getattr(system, name).tobytes())
+    for ship in level.ships:
+        digest.update(struct.pack('<I', ship.fuel_usage))
+    digest.update(struct.pack('<I', len(level.waypoints)))
+    return digest.digest()
+    
+def play_frame(level, steps, dx, dy):
+    # what the window does on each update
+    ship = level.ships[0] if level.ships else None
+    if ship:
+        ship.thrust(dx, dy, steps=steps * level.dt)
+    level.update(steps)
+    
+class Recorder(object):
+    def __init__(self, level, width, height, padding, n_ships, n_planets, n_waypoints):
+        self.level = level
+        self.settings = (level.seed, width, height, padding,
+            n_ships, n_planets, n_waypoints, level.dt, level.integrator)
+        self.frames = []
+        self.checkpoints = []
+        self.ticks = 0
+    def record(self, steps, dx, dy):
+        # call after the level has been updated
+        self.frames.append((steps, dx, dy))
+        before = self.ticks
+        self.ticks += steps * self.level.dt
+        if self.ticks // INTERVAL > before // INTERVAL:
+            frame = len(self.frames)
+            digest = np.frombuffer(state_hash(self.level), np.uint8)
+            self.checkpoints.append((frame, self.ticks, digest))
+    def dumps(self):
+        settings = list(self.settings)
+        settings[-1] = settings[-1].encode('ascii')
+        data = [HEADER.pack(MAGIC, *settings)]
+        for items, dtype in ((self.frames, FRAME), (self.checkpoints, CHECKPOINT)):
+            data.append(COUNT.pack(len(items)))
+            data.append(np.array(items, dtype=dtype).tobytes())
+        return b''.join(data)
+    def save(self, path):
+        with open(path, 'wb') as fp:
+            fp.write(self.dumps())
+            
+class Player(object):
+    def __init__(self, data):
+        fields = HEADER.unpack_from(data)
+        if fields[0] != MAGIC:
+            raise ValueError('not a replay')
+        self.settings = fields[1:-1] + (fields[-1].rstrip(b'\0').decode('ascii'),)
+        offset = HEADER.size
+        arrays = []
+        for dtype in (FRAME, CHECKPOINT):
+            count, = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            arrays.append(np.frombuffer(data, dtype, count, offset))
+            offset += count * dtype.itemsize
+        self.frames, self.checkpoints = arrays
+        # level snapshots taken at checkpoints while playing, by frame index
+        self.snapshots = {}
+        self.level = None
+        self.start = None
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fp:
+            return cls(fp.read())
+    def create_level(self):
+        seed, width, height, padding, n_ships, n_planets, n_waypoints, dt, integrator = self.settings
+        level = model.random_level(
+            width, height, padding, n_ships, n_planets, n_waypoints, seed)
+        level.dt = dt
+        level.integrator = integrator
+        return level
+    def play(self, level, start, end):
+        checkpoints = dict(
+            (int(c['frame']), c['hash'].tobytes()) for c in self.checkpoints)
+        mismatches = []
+        for index in range(start, end):
+            frame = self.frames[index]
+            play_frame(level, int(frame['steps']), int(frame['dx']), int(frame['dy']))
+            if index + 1 in checkpoints:
+                if state_hash(level) != checkpoints[index + 1]:
+                    mismatches.append(index + 1)
+                if index + 1 not in self.snapshots:
+                    self.snapshots[index + 1] = level.snapshot()
+        return mismatches
+    def run(self):
+        # replay everything as fast as possible, returns the frames whose
+        # checkpoint hash did not match the recording
+        self.level = self.create_level()
+        self.start = self.level.snapshot()
+        return self.play(self.level, 0, len(self.frames))
+    def frame_at(self, tick):
+        ticks = np.cumsum(self.frames['steps'].astype(int)) * self.settings[7]
+        return int(np.searchsorted(ticks, tick, side='right'))
+    def seek(self, tick):
+        # level state after the last frame ending at or before the tick,
+        # starting from the closest snapshot instead of from zero
+        if self.level is None:
+            self.level = self.create_level()
+            self.start = self.level.snapshot()
+        frame = self.frame_at(tick)
+        starts = [index for index in self.snapshots if index <= frame]
+        start = max(starts) if starts else 0
+        self.level.restore(self.snapshots[start] if starts else self.start)
+        self.play(self.level, start, frame)
+        return self.level
+def main():
+    for path in sys.argv[1:]:
+        player = Player.load(path)
+        start = timeit.default_timer()
+        mismatches = player.run()
+        duration = timeit.default_timer() - start
+        status = 'ok' if not mismatches else 'diverged at frames %s' % mismatches
+        print('%s: %d frames in %.3fs, %s' % (path, len(player.frames), duration, status))
+        
+if __name__ == '__main__':
+    main()
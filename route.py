@@ -0,0 +1,207 @@
+import argparse
+import headless
+import model
+import numpy as np
+import physics
+import timeit
+
+# transfer costs kept for recent planet layouts
+CACHE_SIZE = 64
+
+# largest number of waypoints ordered exactly, more fall back to the
+# nearest waypoint first
+EXACT = 12
+
+cache = {}
+
+class Route(object):
+    # best order for visiting the waypoints and what it costs, ticks are
+    # milliseconds and fuel is counted like Ship.fuel_usage, both are
+    # infinite when some transfer on the way can't be flown
+    def __init__(self, order, ticks, fuel):
+        self.order = order
+        self.ticks = ticks
+        self.fuel = fuel
+    @property
+    def par_time(self):
+        return self.ticks / 1000.0
+    @property
+    def par_fuel(self):
+        return self.fuel
+        
+def avoid(x, y, field, margin=80):
+    # unit vectors away from the planets closer than the margin, weighted
+    # by how close they are
+    dx = x[:, None] - field.x
+    dy = y[:, None] - field.y
+    d = np.hypot(dx, dy)
+    gap = np.maximum(d - field.r, 1)
+    w = np.where(gap < margin, (margin / gap) ** 2 - 1, 0) / d
+    return (w * dx).sum(axis=1), (w * dy).sum(axis=1)
+    
+def simulate(field, start, end, ticks=30000, steps=16, dt=4, speed=0.08, tau=500.0):
+    # flies a ship from rest at each start point to the matching end
+    # circle. thrust is picked every few steps to reach a modest speed
+    # towards the target, bent away from nearby planets, with the pull of
+    # the field cancelled out. returns the ticks and fuel of each
+    # transfer, infinite where the ship crashed or ran out of time
+    count = len(start)
+    x, y = start[:, 0].astype(float), start[:, 1].astype(float)
+    vx, vy = np.zeros(count), np.zeros(count)
+    tx, ty, tr = end[:, 0], end[:, 1], end[:, 2] + model.Ship.RADIUS
+    limit = (field.r + model.Ship.RADIUS) ** 2
+    slack = model.Ship.POWER * 0.3
+    time = np.full(count, np.inf)
+    fuel = np.zeros(count)
+    active = np.arange(count)
+    for tick in range(0, ticks, steps * dt):
+        if not len(active):
+            break
+        px, py = x[active], y[active]
+        dx, dy = tx[active] - px, ty[active] - py
+        d = np.hypot(dx, dy)
+        d[d == 0] = 1
+        ax, ay = avoid(px, py, field)
+        ux, uy = dx / d + ax, dy / d + ay
+        u = np.hypot(ux, uy)
+        u[u == 0] = 1
+        gx, gy = field.sample(px, py)
+        rx = (ux / u * speed - vx[active]) / tau - gx
+        ry = (uy / u * speed - vy[active]) / tau - gy
+        ix = np.where(np.abs(rx) > slack, np.sign(rx), 0)
+        iy = np.where(np.abs(ry) > slack, np.sign(ry), 0)
+        fuel[active] += ((ix != 0) | (iy != 0)) * steps * dt
+        for step in range(steps):
+            if not len(active):
+                break
+            px, py = x[active], y[active]
+            fx, fy = field.sample(px, py)
+            vx[active] += (fx + ix * model.Ship.POWER) * dt
+            vy[active] += (fy + iy * model.Ship.POWER) * dt
+            x[active] += vx[active] * dt
+            y[active] += vy[active] * dt
+            px, py = x[active], y[active]
+            arrived = np.hypot(px - tx[active], py - ty[active]) < tr[active]
+            crashed = (((px[:, None] - field.x) ** 2 +
+                (py[:, None] - field.y) ** 2) < limit).any(axis=1)
+            time[active[arrived]] = tick + (step + 1) * dt
+            keep = ~arrived & ~crashed
+            active, ix, iy = active[keep], ix[keep], iy[keep]
+    fuel[np.isinf(time)] = np.inf
+    return time, fuel
+    
+def costs(level):
+    # ticks and fuel for every transfer between the ship (row and column
+    # 0) and the waypoints left, each pair is simulated once per planet
+    # layout and reused by any level with the same planets
+    key = physics.field_key(level.planet_bodies)
+    if key not in cache:
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        cache[key] = {}
+    pairs = cache[key]
+    ship = level.ships[0]
+    points = [(ship.body.x, ship.body.y, 0)]
+    points += [waypoint.xyr for waypoint in level.waypoints]
+    n = len(points)
+    missing = [(a, b) for a in points for b in points[1:]
+        if a != b and (a, b) not in pairs]
+    if missing:
+        start = np.array([a for a, b in missing], dtype=float)
+        end = np.array([b for a, b in missing], dtype=float)
+        time, fuel = simulate(level.field, start, end)
+        for pair, t, f in zip(missing, time, fuel):
+            pairs[pair] = (t, f)
+    time = np.full((n, n), np.inf)
+    fuel = np.full((n, n), np.inf)
+    for i, a in enumerate(points):
+        for j, b in enumerate(points[1:], 1):
+            if a != b:
+                time[i, j], fuel[i, j] = pairs[(a, b)]
+    return time, fuel
+    
+def shortest_path(cost):
+    # held-karp over subsets of the waypoints, node 0 is the start and the
+    # path ends wherever is cheapest. returns the order and its cost
+    n = len(cost) - 1
+    if n == 0:
+        return [], 0.0
+    if n > EXACT:
+        return nearest_path(cost)
+    inner = cost[1:, 1:]
+    full = 1 << n
+    best = np.full((full, n), np.inf)
+    parent = np.zeros((full, n), dtype=int)
+    for j in range(n):
+        best[1 << j, j] = cost[0, j + 1]
+    for mask in range(1, full):
+        row = best[mask]
+        if not np.isfinite(row).any():
+            continue
+        # cheapest way into each node k from the last node j of the subset
+        total = row[:, None] + inner
+        last = total.argmin(axis=0)
+        value = total[last, np.arange(n)]
+        for k in range(n):
+            if mask & (1 << k):
+                continue
+            other = mask | (1 << k)
+            if value[k] < best[other, k]:
+                best[other, k] = value[k]
+                parent[other, k] = last[k]
+    mask = full - 1
+    j = int(best[mask].argmin())
+    total = best[mask, j]
+    if not np.isfinite(total):
+        # no order gets through every waypoint
+        return nearest_path(cost)
+    order = []
+    while mask:
+        order.append(j)
+        previous = parent[mask, j]
+        mask &= ~(1 << j)
+        j = previous
+    return order[::-1], total
+    
+def nearest_path(cost):
+    order = []
+    i = 0
+    total = 0.0
+    left = set(range(1, len(cost)))
+    while left:
+        j = min(left, key=lambda j: cost[i, j])
+        total += cost[i, j]
+        order.append(j - 1)
+        left.remove(j)
+        i = j
+    return order, total
+    
+def solve(level, objective='ticks'):
+    # best route through the waypoints left, by time or by fuel
+    time, fuel = costs(level)
+    order, total = shortest_path(time if objective == 'ticks' else fuel)
+    nodes = [0] + [i + 1 for i in order]
+    ticks = sum(time[a, b] for a, b in zip(nodes, nodes[1:]))
+    used = sum(fuel[a, b] for a, b in zip(nodes, nodes[1:]))
+    return Route([level.waypoints[i] for i in order], ticks, used)
+    
+def main():
+    parser = argparse.ArgumentParser(
+        description='Par time and fuel of random levels.')
+    parser.add_argument('--levels', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for seed in range(args.seed, args.seed + args.levels):
+        level = headless.create_level(seed)
+        start = timeit.default_timer()
+        route = solve(level)
+        elapsed = timeit.default_timer() - start
+        start = timeit.default_timer()
+        solve(level)
+        cached = timeit.default_timer() - start
+        print('seed %d par time %6.1f s par fuel %8.0f  %.0f ms, %.2f ms cached' % (
+            seed, route.par_time, route.par_fuel, elapsed * 1000, cached * 1000))
+        
+if __name__ == '__main__':
+    main()
+    
@@ -0,0 +1,303 @@
+import asyncio
+import model
+import numpy as np
+import poisson
+import random
+import struct
+import timeit
+
+# every frame is a message type and the payload length
+FRAME = struct.Struct('<BI')
+WELCOME = 1
+STATE = 2
+
+# seed, width, height, padding, planets, waypoints, ticks per frame
+SETTINGS = struct.Struct('<IiiiiiH')
+
+# tick, own ship id, then how many ships are sent in full, as deltas and
+# as gone, and how many waypoints were collected since the last state
+STATE_HEADER = struct.Struct('<IHHHHH')
+
+# ships new to a client are sent in full, the rest as 16 bit deltas
+# against what the client already has, unchanged ships aren't sent
+FULL = np.dtype([('id', '<u2'), ('state', '<i4', 4)])
+DELTA = np.dtype([('id', '<u2'), ('state', '<i2', 4)])
+
+# thrust held by a client, sent whenever it changes
+INPUT = struct.Struct('<bb')
+
+# ship id meaning no ship
+NONE = 0xffff
+
+# x and y in 1/8 pixels, dx and dy in 1/4096 pixels per millisecond
+SCALE = np.array([8.0, 8.0, 4096.0, 4096.0])
+
+def quantize(x, y, dx, dy):
+    values = np.array([x, y, dx, dy]).T * SCALE
+    return np.round(values).astype(np.int64)
+    
+def neighbours(x, y, radius, limit):
+    # indices of the ships within the radius of each ship, at most limit
+    # of them and the nearest ones first. ships are binned into cells one
+    # radius wide, so each only looks at the 3x3 cells around it
+    keys = (np.floor(x / radius).astype(np.int64) << 32) + np.floor(y / radius).astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys_sorted = keys[order]
+    offsets = np.array([(i << 32) + j for i in (-1, 0, 1) for j in (-1, 0, 1)])
+    cells = keys[:, None] + offsets
+    lo = np.searchsorted(keys_sorted, cells, 'left')
+    hi = np.searchsorted(keys_sorted, cells, 'right')
+    result = []
+    for i in range(len(keys)):
+        near = np.concatenate([order[a:b] for a, b in zip(lo[i], hi[i])])
+        d = (x[near] - x[i]) ** 2 + (y[near] - y[i]) ** 2
+        inside = d <= radius * radius
+        near, d = near[inside], d[inside]
+        if len(near) > limit:
+            near = near[np.argpartition(d, limit - 1)[:limit]]
+        result.append(near)
+    return result
+    
+def encode_state(tick, you, baseline, ids, states, waypoints):
+    # the state message taking a client from its baseline (sorted ids and
+    # their states) to the ships given, returns the message and the new
+    # baseline
+    order = np.argsort(ids)
+    ids, states = ids[order], states[order]
+    base_ids, base_states = baseline
+    if len(base_ids):
+        pos = np.minimum(np.searchsorted(base_ids, ids), len(base_ids) - 1)
+        known = base_ids[pos] == ids
+        delta = states - base_states[pos]
+    else:
+        known = np.zeros(len(ids), dtype=bool)
+        delta = states
+    full = ~known | (np.abs(delta).max(axis=1) > 0x7fff)
+    partial = ~full & delta.any(axis=1)
+    gone = np.setdiff1d(base_ids, ids).astype('<u2')
+    full_entries = np.zeros(full.sum(), FULL)
+    full_entries['id'] = ids[full]
+    full_entries['state'] = states[full]
+    delta_entries = np.zeros(partial.sum(), DELTA)
+    delta_entries['id'] = ids[partial]
+    delta_entries['state'] = delta[partial]
+    header = STATE_HEADER.pack(tick & 0xffffffff, you, len(full_entries),
+        len(delta_entries), len(gone), len(waypoints))
+    payload = b''.join([header, full_entries.tobytes(), delta_entries.tobytes(),
+        gone.tobytes(), np.array(waypoints, dtype='<u2').tobytes()])
+    return payload, (ids, states)
+    
+def decode_state(data, ships):
+    # applies a state payload to a dict of ship id to quantized state,
+    # returns the tick, own ship id and the waypoints collected
+    tick, you, n_full, n_delta, n_gone, n_waypoints = STATE_HEADER.unpack_from(data)
+    offset = STATE_HEADER.size
+    full = np.frombuffer(data, FULL, n_full, offset)
+    offset += full.nbytes
+    delta = np.frombuffer(data, DELTA, n_delta, offset)
+    offset += delta.nbytes
+    gone = np.frombuffer(data, '<u2', n_gone, offset)
+    offset += gone.nbytes
+    waypoints = np.frombuffer(data, '<u2', n_waypoints, offset)
+    for id in gone.tolist():
+        del ships[id]
+    for id, state in zip(full['id'].tolist(), full['state'].astype(np.int64)):
+        ships[id] = state
+    for id, state in zip(delta['id'].tolist(), delta['state']):
+        ships[id] = ships[id] + state
+    return tick, you, waypoints.tolist()
+    
+def pack_frame(kind, payload):
+    return FRAME.pack(kind, len(payload)) + payload
+    
+async def read_frame(reader):
+    kind, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length)
+    
+class Connection(object):
+    # what the server knows about one client and what it last sent it
+    def __init__(self, writer):
+        self.writer = writer
+        self.ship = None
+        self.thrust = (0, 0)
+        self.baseline = (np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64))
+        self.collected = 0
+        self.bytes = 0
+        
+class Server(object):
+    # runs one level authoritatively. clients send their thrust and get back
+    # the ships nearest their own, each as a delta against what they have,
+    # so what a client is sent doesn't grow with the number of players
+    def __init__(self, seed=None, width=2880, height=1920, padding=25,
+            n_planets=30, n_waypoints=60, steps=16, broadcast=3, radius=640,
+            visible=32):
+        if seed is None:
+            seed = random.randint(0, 0xffffffff)
+        self.settings = (seed, width, height, padding, n_planets, n_waypoints, steps)
+        self.level = model.random_level(width, height, padding, 0,
+            n_planets, n_waypoints, seed)
+        self.level.push_handlers(self)
+        self.rng = random.Random(seed)
+        self.steps = steps
+        self.broadcast_interval = broadcast
+        self.radius = radius
+        self.visible = visible
+        self.connections = []
+        # every ship ever made keeps its id, ships left behind by clients
+        # that went away are handed to the next ones to join, so the level
+        # roster never grows past the most players at once
+        self.ids = {}
+        self.next_id = 0
+        self.spare = []
+        self.collected = []
+        self.ticks = 0
+        self.frames = 0
+        self.busy = 0.0
+    def alive(self, ship):
+        return ship is not None and ship in self.level.slots
+    def spawn(self, ship=None):
+        # puts the ship, a spare one or a new one at rest on a free spot
+        # away from everything else in the level
+        width, height, padding = self.settings[1:4]
+        sampler = poisson.Sampler(width, height, padding * 2, self.rng)
+        for entity in self.level.planets + self.level.waypoints + self.level.ships:
+            sampler.add(entity.xyr)
+        x, y, r = sampler.place(model.Ship.RADIUS)
+        if ship is None and self.spare:
+            ship = self.spare.pop()
+        if ship is None:
+            ship = model.Ship(x, y)
+            self.ids[ship] = self.next_id
+            self.next_id = (self.next_id + 1) % NONE
+        body = ship.body
+        body.x = body.px = x
+        body.y = body.py = y
+        body.dx = body.dy = 0.0
+        ship.thrust(0, 0)
+        ship.fuel_usage = 0
+        self.level.add(ship)
+        return ship
+    def on_waypoint_collision(self, ship, waypoint):
+        self.collected.append(self.level.roster_index[waypoint])
+    async def handle(self, reader, writer):
+        connection = Connection(writer)
+        self.connections.append(connection)
+        writer.write(pack_frame(WELCOME, SETTINGS.pack(*self.settings)))
+        try:
+            while True:
+                data = await reader.readexactly(INPUT.size)
+                connection.thrust = INPUT.unpack(data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.connections.remove(connection)
+        if self.alive(connection.ship):
+            self.level.remove(connection.ship)
+        if connection.ship is not None:
+            self.spare.append(connection.ship)
+        writer.close()
+    def step(self):
+        start = timeit.default_timer()
+        ticks = self.steps * self.level.dt
+        for connection in self.connections:
+            ship = connection.ship
+            if not self.alive(ship):
+                # crashed on the last step or joined a full level, back in
+                # somewhere else once there's room
+                try:
+                    ship = connection.ship = self.spawn(ship)
+                except poisson.LayoutError:
+                    continue
+            ship.thrust(*connection.thrust, steps=ticks)
+        self.level.update(self.steps)
+        self.ticks += ticks
+        self.frames += 1
+        if self.frames % self.broadcast_interval == 0:
+            self.broadcast()
+        self.busy += timeit.default_timer() - start
+    def broadcast(self):
+        ships = self.level.ships
+        if not ships:
+            return
+        system = self.level.system
+        index = self.level.ship_index
+        x, y = system.x[index], system.y[index]
+        states = quantize(x, y, system.dx[index], system.dy[index])
+        ids = np.array([self.ids[ship] for ship in ships], dtype=np.int64)
+        near = neighbours(x, y, self.radius, self.visible)
+        for connection in self.connections:
+            if not self.alive(connection.ship):
+                continue
+            i = self.level.slots[connection.ship]
+            waypoints = self.collected[connection.collected:]
+            connection.collected = len(self.collected)
+            payload, connection.baseline = encode_state(self.ticks, ids[i],
+                connection.baseline, ids[near[i]], states[near[i]], waypoints)
+            frame = pack_frame(STATE, payload)
+            connection.bytes += len(frame)
+            connection.writer.write(frame)
+    async def run(self, seconds=None):
+        # steps in real time, a frame is steps ticks of one millisecond
+        interval = self.steps * self.level.dt / 1000.0
+        loop = asyncio.get_running_loop()
+        start = next = loop.time()
+        while seconds is None or loop.time() - start < seconds:
+            self.step()
+            next += interval
+            await asyncio.sleep(max(0, next - loop.time()))
+            
+class Client(object):
+    # mirrors the ships the server sends, thrust comes from a policy called
+    # with the client after every state
+    def __init__(self, policy=None):
+        self.policy = policy
+        self.ships = {}
+        self.you = NONE
+        self.planets = []
+        self.waypoints = []
+        self.collected = set()
+        self.thrust = (0, 0)
+        self.states = 0
+        self.bytes = 0
+    async def connect(self, host='127.0.0.1', port=7777):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        kind, payload = await read_frame(self.reader)
+        seed, width, height, padding, n_planets, n_waypoints, steps = SETTINGS.unpack(payload)
+        # same planets and waypoints as the server, ships come over the wire
+        ships, self.planets, self.waypoints = model.random_layout(width, height,
+            padding, 0, n_planets, n_waypoints, random.Random(seed))
+    async def run(self):
+        try:
+            while True:
+                kind, payload = await read_frame(self.reader)
+                self.bytes += FRAME.size + len(payload)
+                if kind == STATE:
+                    self.on_state(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+    def on_state(self, payload):
+        tick, self.you, waypoints = decode_state(payload, self.ships)
+        self.collected.update(waypoints)
+        self.states += 1
+        thrust = self.policy(self) if self.policy else (0, 0)
+        if thrust != self.thrust:
+            self.thrust = thrust
+            self.writer.write(INPUT.pack(*thrust))
+    def position(self, id=None):
+        state = self.ships.get(self.you if id is None else id)
+        return None if state is None else state / SCALE
+    def close(self):
+        self.writer.close()
+        
+async def serve(host='0.0.0.0', port=7777):
+    server = Server()
+    listener = await asyncio.start_server(server.handle, host, port)
+    print('seed %d, listening on port %d' % (server.settings[0], port))
+    async with listener:
+        await server.run()
+        
+def main():
+    asyncio.run(serve())
+    
+if __name__ == '__main__':
+    main()
+    
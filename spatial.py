@@ -0,0 +1,63 @@
+import math
+import numpy as np
+
+class SpatialHash(object):
+    # uniform grid of cells holding (x, y, r) items, static items are added
+    # once and moving objects only query the cells they overlap
+    def __init__(self, size=64):
+        self.size = size
+        self.cells = {}
+        self._keys = None
+    def cell_range(self, x, y, r):
+        size = float(self.size)
+        i0, i1 = int(math.floor((x - r) / size)), int(math.floor((x + r) / size))
+        j0, j1 = int(math.floor((y - r) / size)), int(math.floor((y + r) / size))
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield (i, j)
+    def encode(self, i, j):
+        return i * (1 << 32) + j
+    def add(self, item, xyr):
+        for cell in self.cell_range(*xyr):
+            self.cells.setdefault(cell, []).append(item)
+        self.update_keys()
+    def remove(self, item, xyr):
+        for cell in self.cell_range(*xyr):
+            items = self.cells.get(cell)
+            if items and item in items:
+                items.remove(item)
+                if not items:
+                    del self.cells[cell]
+        self.update_keys()
+    def update_keys(self):
+        # rebuilt on the next use, adding many items costs one sort
+        self._keys = None
+    @property
+    def keys(self):
+        if self._keys is None:
+            keys = [self.encode(i, j) for i, j in self.cells]
+            self._keys = np.array(sorted(keys), dtype=np.int64)
+        return self._keys
+    def query(self, xyr):
+        result = []
+        seen = set()
+        for cell in self.cell_range(*xyr):
+            for item in self.cells.get(cell, ()):
+                if item not in seen:
+                    seen.add(item)
+                    result.append(item)
+        return result
+    def candidates(self, x, y, r):
+        # mask of the circles that overlap at least one occupied cell,
+        # circles smaller than a cell touch at most their four corner cells
+        # and larger ones are always passed on to query
+        mask = np.zeros(len(x), dtype=bool)
+        if not len(self.keys):
+            return mask
+        mask |= r >= self.size
+        for sx in (-1, 1):
+            for sy in (-1, 1):
+                i = np.floor((x + sx * r) / self.size).astype(np.int64)
+                j = np.floor((y + sy * r) / self.size).astype(np.int64)
+                mask |= np.isin(self.encode(i, j), self.keys)
+        return mask
@@ -0,0 +1,57 @@
+import argparse
+import json
+import subprocess
+import sys
+import timeit
+
+# modules timed on their own, each in a fresh interpreter
+MODULES = ['physics', 'model', 'view', 'main']
+
+def import_time(module):
+    code = ('import timeit; start = timeit.default_timer(); import %s; '
+        'print(timeit.default_timer() - start)' % module)
+    try:
+        output = subprocess.check_output([sys.executable, '-c', code],
+            stderr=subprocess.STDOUT)
+        return float(output.split()[-1])
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+        
+def first_frame():
+    # seconds from starting the game to its first frame being drawn,
+    # None where no window can be opened
+    start = timeit.default_timer()
+    process = subprocess.Popen([sys.executable, 'main.py', '--startup'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    elapsed = None
+    for line in process.stdout:
+        if line.startswith(b'first frame'):
+            elapsed = timeit.default_timer() - start
+            break
+    process.communicate()
+    return elapsed
+    
+def median(values):
+    values = sorted(value for value in values if value is not None)
+    return values[len(values) // 2] if values else None
+    
+def main():
+    parser = argparse.ArgumentParser(description='Startup time benchmark.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='startup.json')
+    args = parser.parse_args()
+    result = {'imports': {}, 'runs': args.runs}
+    for module in MODULES:
+        seconds = median(import_time(module) for i in range(args.runs))
+        result['imports'][module] = seconds
+        print('import %-8s %s' % (module,
+            '%.3f s' % seconds if seconds is not None else 'failed'))
+    seconds = median(first_frame() for i in range(args.runs))
+    result['first_frame'] = seconds
+    print('first frame     %s' % ('%.3f s' % seconds if seconds is not None else 'failed'))
+    with open(args.output, 'w') as fp:
+        json.dump(result, fp, indent=2)
+        
+if __name__ == '__main__':
+    main()
+    
\ No newline at end of file
@@ -0,0 +1,45 @@
+import levelpack
+import model
+import pytest
+
+SETTINGS = (960, 640, 25, 1, 5, 5)
+
+def build(tmp_path, seeds):
+    writer = levelpack.Writer()
+    for i, seed in enumerate(seeds):
+        level = model.random_level(*SETTINGS + (seed,))
+        writer.add(level, 960, 640, par_time=10.0 + i, par_fuel=20.0 + i,
+            difficulty=0.5 * i)
+    path = str(tmp_path / 'levels.pack')
+    writer.save(path)
+    return levelpack.Pack(path)
+    
+def test_levels_load_as_generated(tmp_path):
+    seeds = [3, 17, 123456]
+    pack = build(tmp_path, seeds)
+    assert len(pack) == len(seeds)
+    for i, seed in enumerate(seeds):
+        expected = model.random_level(*SETTINGS + (seed,))
+        level = pack.level(i)
+        assert level.seed == seed
+        for a, b in [(level.ships, expected.ships), (level.planets, expected.planets),
+                (level.waypoints, expected.waypoints)]:
+            assert [entity.xyr for entity in a] == [entity.xyr for entity in b]
+        for a, b in zip(level.planets, expected.planets):
+            assert a.image == b.image
+            assert a.rotation == b.rotation
+    pack.close()
+    
+def test_metadata(tmp_path):
+    pack = build(tmp_path, [1, 2])
+    record = pack[1]
+    assert (record.seed, record.width, record.height) == (2, 960, 640)
+    assert (record.par_time, record.par_fuel, record.difficulty) == (11.0, 21.0, 0.5)
+    pack.close()
+    
+def test_bad_magic(tmp_path):
+    path = tmp_path / 'bad.pack'
+    path.write_bytes(b'XXXX' + levelpack.Writer().dumps()[4:])
+    with pytest.raises(ValueError):
+        levelpack.Pack(str(path))
+        
\ No newline at end of file
@@ -0,0 +1,84 @@
+import model
+import random
+
+class Events(object):
+    def __init__(self):
+        self.events = []
+    def on_planet_collision(self, ship, planet):
+        self.events.append(('planet', ship, planet))
+    def on_waypoint_collision(self, ship, waypoint):
+        self.events.append(('waypoint', ship, waypoint))
+        
+def level(planets, waypoints, dx, dy=0.0):
+    # one ship at the left, far from any planet so gravity barely matters
+    result = model.Level()
+    result.ships = [model.Ship(100, 320)]
+    result.planets = [model.Planet(x, y, r) for x, y, r in planets]
+    result.waypoints = [model.Waypoint(x, y, r) for x, y, r in waypoints]
+    result.finish()
+    result.ships[0].body.dx = dx
+    result.ships[0].body.dy = dy
+    events = Events()
+    result.push_handlers(events)
+    return result, events.events
+    
+def test_fast_ship_hits_planet_it_jumps_over():
+    lvl, events = level([(300, 320, 30)], [], 400)
+    ship, planet = lvl.ships[0], lvl.planets[0]
+    lvl.update()
+    # the ship ends the step well past the planet
+    assert ship.body.x > 450
+    assert events == [('planet', ship, planet)]
+    assert lvl.ships == []
+    
+def test_fast_ship_collects_waypoint_it_jumps_over():
+    lvl, events = level([], [(300, 320, 20), (600, 320, 20)], 400)
+    ship, first, second = lvl.ships[0], lvl.waypoints[0], lvl.waypoints[1]
+    lvl.update()
+    assert events == [('waypoint', ship, first)]
+    assert lvl.waypoints == [second]
+    assert lvl.ships == [ship]
+    
+def test_near_miss():
+    lvl, events = level([(300, 380, 30)], [(300, 260, 20)], 400)
+    lvl.update()
+    assert events == []
+    assert len(lvl.ships) == 1 and len(lvl.waypoints) == 1
+    
+def check_slots(lvl):
+    for entities in (lvl.ships, lvl.planets, lvl.waypoints):
+        assert len(set(entities)) == len(entities)
+        for i, entity in enumerate(entities):
+            assert lvl.slots[entity] == i
+    assert len(lvl.slots) == len(lvl.ships) + len(lvl.planets) + len(lvl.waypoints)
+    bodies = lvl.system.bodies
+    assert len(bodies) == lvl.system.size == len(lvl.planets) + len(lvl.ships)
+    for i, body in enumerate(bodies):
+        assert body.index == i and body.system is lvl.system
+    assert [bodies[i] for i in lvl.ship_index] == [ship.body for ship in lvl.ships]
+    
+def test_add_remove_keeps_slots():
+    lvl = model.random_level(2880, 1920, 25, 6, 10, 30, seed=5)
+    ships, waypoints = list(lvl.ships), list(lvl.waypoints)
+    roster = dict(lvl.roster_index)
+    added, removed = [], []
+    events = Events()
+    events.on_add = added.append
+    events.on_remove = removed.append
+    lvl.push_handlers(events)
+    rng = random.Random(5)
+    for i in range(500):
+        entity = rng.choice(ships + waypoints)
+        if entity in lvl.slots:
+            x, y = entity.xyr[:2]
+            lvl.remove(entity)
+            assert removed[-1] is entity
+            # a removed ship keeps its state in a system of its own
+            assert entity.xyr[:2] == (x, y)
+        else:
+            lvl.add(entity)
+            assert added[-1] is entity
+        check_slots(lvl)
+    # snapshots still refer to every entity by its first place
+    assert lvl.roster_index == roster
+    
\ No newline at end of file
@@ -0,0 +1,95 @@
+import numpy as np
+import physics
+
+def bodies():
+    fixed = [physics.Body(300, 300, 50), physics.Body(650, 350, 40),
+        physics.Body(480, 120, 30)]
+    ships = [physics.Body(x, y, 12, fixed=False)
+        for x, y in [(200, 150), (480, 320), (700, 550), (820, 120)]]
+    for i, ship in enumerate(ships):
+        ship.dx = 0.05 * (i - 1.5)
+        ship.dy = 0.03 * (1 - i)
+    return fixed + ships
+    
+def loop_update(bodies):
+    # the per-body loop physics.update replaced
+    results = {}
+    for body in bodies:
+        if body.fixed:
+            continue
+        tx, ty = 0, 0
+        for other in bodies:
+            if other is body:
+                continue
+            dx, dy = other.x - body.x, other.y - body.y
+            d = (dx * dx + dy * dy) ** 0.5
+            magnitude = physics.G * other.mass / (d * d)
+            tx, ty = tx + dx / d * magnitude, ty + dy / d * magnitude
+        results[body] = (tx, ty)
+    for body, (dx, dy) in results.items():
+        body.force(dx, dy)
+        body.move()
+        
+def test_update_matches_loop():
+    vectorized, looped = bodies(), bodies()
+    for i in range(10):
+        physics.update(vectorized, steps=50)
+        for step in range(50):
+            loop_update(looped)
+        for a, b in zip(vectorized, looped):
+            assert np.allclose([a.x, a.y, a.dx, a.dy], [b.x, b.y, b.dx, b.dy],
+                rtol=1e-9, atol=1e-9)
+                
+def test_fixed_bodies_stay_put():
+    items = bodies()
+    physics.update(items, steps=100)
+    assert [body.xyr for body in items[:3]] == [(300, 300, 50), (650, 350, 40), (480, 120, 30)]
+    assert all(body.system is items[0].system for body in items)
+    
+def test_field_matches_direct_summation():
+    planets = bodies()[:3]
+    field = physics.Field(planets)
+    x, y, r = np.array([body.xyr for body in planets]).T
+    rng = np.random.RandomState(0)
+    tx, ty = rng.uniform(0, 960, 5000), rng.uniform(0, 640, 5000)
+    # points inside a planet are never sampled
+    outside = ((tx[:, None] - x) ** 2 + (ty[:, None] - y) ** 2 > (r + 12) ** 2).all(axis=1)
+    tx, ty = tx[outside], ty[outside]
+    ax, ay = field.sample(tx, ty)
+    ex, ey = physics.accelerations(x, y, r ** 3, tx, ty)
+    error = np.hypot(ax - ex, ay - ey) / np.hypot(ex, ey)
+    assert error.max() < 2e-2
+    assert np.sqrt(np.mean(error ** 2)) < 1e-3
+    
+def test_field_update_matches_direct():
+    direct, sampled = bodies(), bodies()
+    field = physics.Field([body for body in sampled if body.fixed])
+    physics.update(direct, steps=500)
+    physics.update(sampled, field, steps=500)
+    for a, b in zip(direct, sampled):
+        assert abs(a.x - b.x) < 0.5 and abs(a.y - b.y) < 0.5
+        
+def orbit():
+    # a ship on an eccentric orbit around one planet
+    planet = physics.Body(480, 320, 50)
+    ship = physics.Body(630, 320, 12, fixed=False)
+    ship.dy = 0.8 * (physics.G * 50 ** 3 / 150.0) ** 0.5
+    return [planet, ship]
+    
+def test_integrator_drift():
+    euler = abs(physics.drift(orbit(), 2000, 10, 'euler'))
+    verlet = abs(physics.drift(orbit(), 2000, 10, 'verlet'))
+    rk45 = abs(physics.drift(orbit(), 400, 50, 'rk45'))
+    assert verlet < 1e-6 < euler
+    assert rk45 < 1e-6
+    
+def test_integrators_agree():
+    # the same 20000 ticks, each at its own step length
+    ends = {}
+    for integrator, dt in [('euler', 1), ('verlet', 10), ('rk45', 50)]:
+        items = orbit()
+        physics.update(items, steps=20000 // dt, dt=dt, integrator=integrator)
+        ends[integrator] = np.array(items[1].xyr[:2])
+    assert np.hypot(*(ends['verlet'] - ends['rk45'])) < 1
+    assert np.hypot(*(ends['euler'] - ends['rk45'])) < 1
+    
\ No newline at end of file
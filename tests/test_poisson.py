@@ -0,0 +1,35 @@
+import model
+import poisson
+import pytest
+import random
+import util
+
+def test_spacing_and_bounds():
+    sampler = poisson.Sampler(960, 640, 25, random.Random(1))
+    placed = [sampler.place(random.Random(i).randint(10, 40)) for i in range(40)]
+    for i, (x, y, r) in enumerate(placed):
+        assert r + 25 <= x <= 960 - r - 25
+        assert r + 25 <= y <= 640 - r - 25
+        assert util.min_xyr_spacing((x, y, r), placed[:i] + placed[i + 1:]) >= 25
+        
+def test_full_layout_raises():
+    sampler = poisson.Sampler(400, 400, 25, random.Random(2))
+    with pytest.raises(poisson.LayoutError):
+        for i in range(1000):
+            sampler.place(40)
+    # the circles that did fit are kept
+    assert 0 < len(sampler.xyrs) < 1000
+    
+def test_circle_too_large_raises():
+    sampler = poisson.Sampler(100, 100, 25, random.Random(3))
+    with pytest.raises(poisson.LayoutError):
+        sampler.place(30)
+    assert sampler.xyrs == []
+    
+def test_random_layout():
+    rng = random.Random
+    assert model.random_layout(960, 640, 25, 1, 5, 5, rng(4)) == \
+        model.random_layout(960, 640, 25, 1, 5, 5, rng(4))
+    with pytest.raises(poisson.LayoutError):
+        model.random_layout(960, 640, 25, 1, 200, 5, rng(4))
+        
\ No newline at end of file
@@ -0,0 +1,56 @@
+import headless
+import pytest
+import random
+import replay
+
+def record(seed, frames):
+    width, height = headless.WIDTH, headless.HEIGHT
+    level = headless.create_level(seed)
+    recorder = replay.Recorder(level, width, height, 25, 1, 5, 5)
+    rng = random.Random(seed)
+    for i in range(frames):
+        steps = rng.randint(10, 20)
+        dx, dy = rng.randint(-1, 1), rng.randint(-1, 1)
+        replay.play_frame(level, steps, dx, dy)
+        recorder.record(steps, dx, dy)
+    return recorder, level
+    
+def test_round_trip():
+    recorder, level = record(3, 200)
+    player = replay.Player(recorder.dumps())
+    assert player.settings == recorder.settings
+    assert [tuple(frame) for frame in player.frames.tolist()] == recorder.frames
+    assert len(player.checkpoints) == len(recorder.checkpoints)
+    
+def test_replay_is_deterministic():
+    recorder, level = record(3, 200)
+    player = replay.Player(recorder.dumps())
+    assert player.checkpoints.size
+    assert player.run() == []
+    assert replay.state_hash(player.level) == replay.state_hash(level)
+    
+def test_divergence_is_detected():
+    recorder, level = record(3, 200)
+    # thrust flipped for a frame early on
+    steps, dx, dy = recorder.frames[5]
+    recorder.frames[5] = (steps, -dx or 1, dy)
+    assert replay.Player(recorder.dumps()).run()
+    
+def test_seek_matches_playing_through():
+    recorder, level = record(5, 200)
+    player = replay.Player(recorder.dumps())
+    player.run()
+    tick = recorder.ticks // 2
+    frame = player.frame_at(tick)
+    seeked = replay.state_hash(player.seek(tick))
+    fresh = replay.Player(recorder.dumps())
+    fresh.level = fresh.create_level()
+    fresh.play(fresh.level, 0, frame)
+    assert seeked == replay.state_hash(fresh.level)
+    
+def test_bad_magic():
+    recorder, level = record(3, 10)
+    data = recorder.dumps()
+    with pytest.raises(ValueError):
+        replay.Player(b'XXXX' + data[4:])
+        
\ No newline at end of file
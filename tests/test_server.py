@@ -0,0 +1,76 @@
+import numpy as np
+import server
+
+class Writer(object):
+    # decodes every state frame into the mirror a client would keep
+    def __init__(self):
+        self.ships = {}
+        self.waypoints = []
+    def write(self, data):
+        kind, length = server.FRAME.unpack_from(data)
+        if kind == server.STATE:
+            tick, you, waypoints = server.decode_state(data[server.FRAME.size:], self.ships)
+            self.waypoints.extend(waypoints)
+    def close(self):
+        pass
+        
+def check(ships, baseline):
+    ids, states = baseline
+    assert sorted(ships) == ids.tolist()
+    for id, state in zip(ids.tolist(), states):
+        assert (ships[id] == state).all()
+        
+def test_state_round_trip():
+    ships = {}
+    baseline = server.Connection(None).baseline
+    steps = [
+        # new ships
+        ([4, 1, 9], [[0, 0, 0, 0], [100, -100, 5, 5], [8000, 16, -3, 2]]),
+        # small moves, one unchanged
+        ([1, 4, 9], [[101, -90, 5, 6], [0, 0, 0, 0], [8010, 10, -3, 2]]),
+        # a jump past 16 bits, a ship gone and one new
+        ([9, 4, 2], [[8010 + 0x10000, 10, -3, 2], [1, 1, 1, 1], [7, 7, 7, 7]]),
+        # everything gone
+        ([], np.zeros((0, 4))),
+    ]
+    for tick, (ids, states) in enumerate(steps):
+        ids = np.array(ids, dtype=np.int64)
+        states = np.array(states, dtype=np.int64)
+        payload, baseline = server.encode_state(tick, 4, baseline, ids, states,
+            [tick, 40000])
+        assert server.decode_state(payload, ships) == (tick, 4, [tick, 40000])
+        check(ships, baseline)
+        
+def test_unchanged_ships_are_not_sent():
+    ids = np.array([1, 2])
+    states = np.array([[1, 2, 3, 4], [5, 6, 7, 8]])
+    baseline = server.Connection(None).baseline
+    full, baseline = server.encode_state(0, 1, baseline, ids, states, [])
+    again, baseline = server.encode_state(1, 1, baseline, ids, states, [])
+    assert len(again) == server.STATE_HEADER.size < len(full)
+    
+def test_clients_mirror_the_server():
+    game = server.Server(1, visible=8)
+    for i in range(40):
+        connection = server.Connection(Writer())
+        connection.thrust = (i % 3 - 1, (i // 3) % 3 - 1)
+        game.connections.append(connection)
+    for i in range(200):
+        game.step()
+    for connection in game.connections:
+        check(connection.writer.ships, connection.baseline)
+        assert len(connection.writer.ships) <= 8
+        assert connection.writer.waypoints == game.collected[:connection.collected]
+        
+def test_spare_ships_are_reused():
+    # ships of clients that left are handed to the next ones to join
+    game = server.Server(1)
+    roster = len(game.level.roster[0])
+    first = game.spawn()
+    for i in range(100):
+        game.level.remove(first)
+        game.spare.append(first)
+        assert game.spawn() is first
+    assert len(game.level.roster[0]) == roster + 1
+    assert game.ids[first] == 0
+    
\ No newline at end of file
@@ -0,0 +1,62 @@
+import headless
+import model
+import replay
+
+def fly(level, ticks):
+    ship = level.ships[0]
+    for i in range(ticks // 10):
+        if not level.ships:
+            break
+        ship.thrust(1 if (i // 30) % 2 else -1, 1 if (i // 50) % 2 else 0, steps=10)
+        level.update(10)
+        
+def test_dumps_loads():
+    level = headless.create_level(4)
+    fly(level, 500)
+    snapshot = level.snapshot()
+    loaded = model.Snapshot.loads(snapshot.dumps())
+    assert loaded.dumps() == snapshot.dumps()
+    assert (loaded.bodies == snapshot.bodies).all()
+    assert (loaded.waypoints == snapshot.waypoints).all()
+    
+def test_restore_from_loaded():
+    level = headless.create_level(4)
+    fly(level, 500)
+    data = level.snapshot().dumps()
+    digest = replay.state_hash(level)
+    fly(level, 2000)
+    level.restore(model.Snapshot.loads(data))
+    assert replay.state_hash(level) == digest
+    assert level.snapshot().dumps() == data
+    
+def test_restore_brings_back_removed():
+    level = headless.create_level(4)
+    start = level.snapshot()
+    level.remove(level.waypoints[0])
+    level.remove(level.ships[0])
+    level.restore(start)
+    assert level.ships == level.roster[0]
+    assert level.waypoints == level.roster[1]
+    for entities in (level.ships, level.waypoints, level.planets):
+        for i, entity in enumerate(entities):
+            assert level.slots[entity] == i
+            
+def test_snapshot_after_removing_a_ship():
+    level = model.random_level(2880, 1920, 25, 3, 5, 5, seed=7)
+    a, b, c = level.ships
+    for ship, x in zip(level.ships, (1000, 1100, 1200)):
+        ship.body.x = x
+        ship.body.dx = x / 1e4
+    level.remove(a)
+    assert level.ships == [c, b]
+    restored = model.random_level(2880, 1920, 25, 3, 5, 5, seed=7)
+    restored.restore(level.snapshot())
+    a, b, c = restored.ships[0], restored.roster[0][1], restored.roster[0][2]
+    assert restored.ships == [b, c]
+    assert (b.body.x, b.body.dx) == (1100, 0.11)
+    assert (c.body.x, c.body.dx) == (1200, 0.12)
+    # and in place, onto the level the snapshot came from
+    snapshot = level.snapshot()
+    level.update(10)
+    level.restore(snapshot)
+    assert [ship.body.x for ship in level.ships] == [1100, 1200]
@@ -1,27 +1,3 @@
-import os
-from pyglet.gl import *
-
-def load_image(path):
-    image = pyglet.resource.image(path)
-    image.anchor_x = image.width / 2
-    image.anchor_y = image.height / 2
-    return image
-    
-def load_animation(path, duration, last_duration=None):
-    frames = []
-    files = os.listdir(path)
-    for file in files:
-        if file.endswith('.png'):
-            image = load_image(path + '/' + file)
-            frame = pyglet.image.AnimationFrame(image, duration)
-            frames.append(frame)
-    frames[-1].duration = last_duration
-    return pyglet.image.Animation(frames)
-    
-def enable_alpha():
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    
 def copy_coords(dest, src):
     dest.x = src.x
     dest.y = src.y
@@ -0,0 +1,307 @@
+from pyglet.gl import *
+import assets
+import ctypes
+import math
+import model
+import numpy as np
+import particles
+import profiler
+import random
+import util
+
+def enable_alpha():
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    
+class Group(pyglet.graphics.OrderedGroup):
+    def __init__(self, *args, **kwargs):
+        super(Group, self).__init__(*args, **kwargs)
+        self.dx = 0
+        self.dy = 0
+    def set_state(self):
+        glPushMatrix()
+        glTranslatef(self.dx, self.dy, 0)
+    def unset_state(self):
+        glPopMatrix()
+        
+# the batch, the groups drawing it in order and the particles are made by
+# setup() when the first LevelView is, importing the module makes nothing
+batch = None
+background = planets = waypoints = paths = ships = pointers = None
+effects = None
+
+def setup():
+    global batch, background, planets, waypoints, paths, ships, pointers, effects
+    if batch is not None:
+        return
+    batch = pyglet.graphics.Batch()
+    background = Group(0)
+    planets = Group(1)
+    waypoints = Group(2)
+    paths = Group(3)
+    ships = Group(4)
+    pointers = Group(5)
+    effects = particles.ParticleSystem(batch, waypoints)
+    
+class StarField(object):
+    # background stars made chunk by chunk as the camera moves, each chunk
+    # is seeded by its position so it looks the same when the camera comes
+    # back, chunks out of sight are dropped
+    def __init__(self, count=54, min_size=4, max_size=14, size=512, seed=0):
+        self.count = count
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size = size
+        self.seed = seed or 0
+        self.chunks = {}
+    @property
+    def sprites(self):
+        return sum(len(sprites) for sprites in self.chunks.values())
+    def update(self, left, bottom, width, height):
+        pad = self.max_size
+        i0 = int(math.floor((left - pad) / self.size))
+        i1 = int(math.floor((left + width + pad) / self.size))
+        j0 = int(math.floor((bottom - pad) / self.size))
+        j1 = int(math.floor((bottom + height + pad) / self.size))
+        wanted = set((i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+        for key in list(self.chunks):
+            if key not in wanted:
+                for sprite in self.chunks.pop(key):
+                    sprite.delete()
+        for key in wanted:
+            if key not in self.chunks:
+                self.chunks[key] = self.create(*key)
+    def create(self, i, j):
+        rng = random.Random(hash((self.seed, i, j)))
+        image = assets.load_image('images/star.png')
+        min_size, max_size = self.min_size, self.max_size
+        sprites = []
+        for n in range(self.count):
+            size = rng.randint(min_size, max_size)
+            x = (i + rng.random()) * self.size
+            y = (j + rng.random()) * self.size
+            sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=background)
+            sprite.scale = float(size) / image.width
+            sprite.rotation = rng.randint(0, 359)
+            p = float(size - min_size) / float(max_size - min_size)
+            sprite.opacity = (255 - 64) * p + 64
+            sprites.append(sprite)
+        return sprites
+    def delete(self):
+        for sprites in self.chunks.values():
+            for sprite in sprites:
+                sprite.delete()
+        self.chunks = {}
+        
+class ShipView(object):
+    def __init__(self, ship):
+        image_on = assets.load_image('images/ship2-on.png')
+        image_off = assets.load_image('images/ship2-off.png')
+        x, y = ship.body.x, ship.body.y
+        self.ship = ship
+        self.sprite_on = pyglet.sprite.Sprite(image_on, x=x, y=y, batch=batch, group=ships)
+        self.sprite_off = pyglet.sprite.Sprite(image_off, x=x, y=y, batch=batch, group=ships)
+        self.sprite = self.sprite_off
+    def update(self, alpha):
+        x, y = self.ship.body.lerp(alpha)
+        for sprite in (self.sprite_on, self.sprite_off):
+            sprite.x = x
+            sprite.y = y
+            sprite.rotation = self.ship.rotation
+        self.sprite_on.visible = self.ship.thrusting
+        self.sprite_off.visible = not self.ship.thrusting
+    def delete(self):
+        self.sprite_on.delete()
+        self.sprite_off.delete()
+        
+class PlanetView(object):
+    def __init__(self, planet):
+        x, y, r = planet.xyr
+        image = assets.load_image(planet.image)
+        self.sprite = pyglet.sprite.Sprite(image, x=x, y=y, batch=batch, group=planets)
+        self.sprite.scale = float(r) / (image.width / 2)
+        self.sprite.rotation = planet.rotation
+    def show(self, visible):
+        # culled sprites are taken out of the batch altogether
+        self.sprite.batch = batch if visible else None
+    def delete(self):
+        self.sprite.delete()
+        
+class WaypointView(object):
+    def __init__(self, waypoint):
+        #image = assets.load_image('images/waypoint.png')
+        image = assets.load_animation('images/waypoint', 0.01, 0.5)
+        self.sprite = pyglet.sprite.Sprite(image, x=waypoint.x, y=waypoint.y, batch=batch, group=waypoints)
+    def show(self, visible):
+        self.sprite.batch = batch if visible else None
+    def delete(self):
+        self.sprite.delete()
+        
+class PathView(object):
+    # predicted flight path, a single line strip that fades out along
+    # the path, resized in place as the number of points changes
+    def __init__(self):
+        self.vertex_list = None
+    def update(self, points):
+        count = len(points)
+        if count < 2:
+            self.delete()
+            return
+        if self.vertex_list is None:
+            self.vertex_list = batch.add(count, GL_LINE_STRIP, paths,
+                'v2f/stream', 'c4B/stream')
+        elif self.vertex_list.get_size() != count:
+            self.vertex_list.resize(count)
+        colors = np.full((count, 4), 255, dtype=np.uint8)
+        colors[:, 3] = np.linspace(128, 0, count)
+        vertices = np.ascontiguousarray(points, dtype=np.float32)
+        ctypes.memmove(self.vertex_list.vertices, vertices.ctypes.data, vertices.nbytes)
+        ctypes.memmove(self.vertex_list.colors, colors.ctypes.data, colors.nbytes)
+    def delete(self):
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+            self.vertex_list = None
+            
+class LevelView(object):
+    # the window onto the level, the level itself can be any size
+    def __init__(self, level, width=960, height=640):
+        setup()
+        self.level = level
+        self.width = width
+        self.height = height
+        self.views = {}
+        self.visible = set()
+        for entity in level.entities:
+            self.on_add(entity)
+        self.stars = StarField(seed=level.seed)
+        self.pointers = []
+        self.path = PathView()
+        self.offset = (0, 0)
+        level.push_handlers(self)
+    def delete(self):
+        self.level.remove_handlers(self)
+        for view in self.views.values():
+            view.delete()
+        for sprite in self.pointers:
+            sprite.delete()
+        self.stars.delete()
+        self.path.delete()
+        self.views = {}
+        self.visible = set()
+        self.pointers = []
+    def draw(self, alpha=1):
+        with profiler.timer('camera'):
+            self.update_camera(alpha)
+        with profiler.timer('culling'):
+            self.update_culling()
+        with profiler.timer('pointers'):
+            self.update_pointers()
+        if profiler.enabled:
+            sprites = self.stars.sprites + len(self.visible) + len(self.pointers)
+            sprites += 2 * len(self.level.ships)
+            profiler.gauge('sprites', sprites)
+            profiler.gauge('particles', effects.count)
+            # every sprite is a vertex list of its own
+            profiler.gauge('vertex_lists', sprites + len(effects.vertex_lists) +
+                (self.path.vertex_list is not None))
+        with profiler.timer('batch'):
+            batch.draw()
+    def update_camera(self, alpha):
+        width, height = self.width, self.height
+        for ship in self.level.ships:
+            view = self.views[ship]
+            view.update(alpha)
+            x, y = view.sprite.x, view.sprite.y
+            if 1:
+                left = width / 3
+                right = width - left
+                top = height / 3
+                bottom = height - top
+                dx, dy = self.offset
+                sx, sy = int(x), int(y)
+                if sx + dx < left:
+                    dx += left - sx - dx
+                if sx + dx > right:
+                    dx -= sx - right + dx
+                if sy + dy < top:
+                    dy += top - sy - dy
+                if sy + dy > bottom:
+                    dy -= sy - bottom + dy
+                self.offset = (dx, dy)
+                for group in [planets, waypoints, paths, ships]:
+                    #group.dx = 960 / 2 - ship.body.x
+                    #group.dy = 640 / 2 - ship.body.y
+                    group.dx = dx
+                    group.dy = dy
+                for group in [background]:
+                    group.dx = dx / 8
+                    group.dy = dy / 8
+        self.stars.update(-background.dx, -background.dy, width, height)
+    def update_culling(self):
+        # planets and waypoints near the screen are found through the
+        # level's spatial hash, so the cost follows what is on screen
+        dx, dy = self.offset
+        x = self.width / 2.0 - dx
+        y = self.height / 2.0 - dy
+        r = max(self.width, self.height) / 2.0
+        visible = set(self.level.broadphase.query((x, y, r)))
+        for entity in self.visible - visible:
+            if entity in self.views:
+                self.views[entity].show(False)
+        for entity in visible - self.visible:
+            if entity in self.views:
+                self.views[entity].show(True)
+        self.visible = visible
+    def update_pointers(self):
+        # pointer sprites are reused from frame to frame, spare ones hidden
+        count = 0
+        x, y = 50, 50
+        w, h = self.width - x * 2, self.height - y * 2
+        ox, oy = self.offset
+        for ship in self.level.ships:
+            view = self.views[ship]
+            sx, sy = view.sprite.x, view.sprite.y
+            for waypoint in self.level.waypoints:
+                wx, wy = waypoint.x, waypoint.y
+                dx, dy = wx - sx, wy - sy
+                angle = -math.degrees(math.atan2(dy, dx))
+                p2 = (int(sx + ox), int(sy + oy))
+                p1 = (int(wx + ox), int(wy + oy))
+                intersection = util.rectangle_segment_intersection(x, y, w, h, p1, p2)
+                if intersection:
+                    ix, iy = intersection
+                    if count == len(self.pointers):
+                        image = assets.load_image('images/pointer.png')
+                        sprite = pyglet.sprite.Sprite(image, batch=batch, group=pointers)
+                        self.pointers.append(sprite)
+                    sprite = self.pointers[count]
+                    sprite.set_position(ix, iy)
+                    sprite.rotation = angle
+                    sprite.visible = True
+                    count += 1
+        for sprite in self.pointers[count:]:
+            sprite.visible = False
+    def on_add(self, entity):
+        if isinstance(entity, model.Ship):
+            self.views[entity] = ShipView(entity)
+            return
+        if isinstance(entity, model.Planet):
+            self.views[entity] = PlanetView(entity)
+        else:
+            self.views[entity] = WaypointView(entity)
+        # new sprites start out in the batch, culling takes them from there
+        self.visible.add(entity)
+    def on_remove(self, entity):
+        view = self.views.pop(entity, None)
+        if view:
+            view.delete()
+        self.visible.discard(entity)
+    def on_planet_collision(self, ship, planet):
+        x1, y1 = ship.body.x, ship.body.y
+        x2, y2 = planet.body.x, planet.body.y
+        x = x1 + (x2 - x1) / 3
+        y = y1 + (y2 - y1) / 3
+        effects.emit('planet', x, y)
+        effects.emit('explosion', x1, y1, 1)
+    def on_waypoint_collision(self, ship, waypoint):
+        effects.emit('waypoint', waypoint.x, waypoint.y)